@@ -0,0 +1,376 @@
+#! /usr/bin/env -S python3 -OO
+
+# benchmarks/bench.py
+
+"""Times startup, reload, selection, every backdrop style and filler, overlays
+and compositing against a synthetic library, without touching the desktop.
+
+    benchmarks/bench.py run [--count 500] [--engine pillow] [--output FILE]
+    benchmarks/bench.py compare BASE.json HEAD.json
+
+Results are written as JSON (by default to benchmarks/results/<commit>.json)
+so runs on different commits can be compared.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Final
+
+ROOT: Final[str] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.library import DEFAULTS, generate  # noqa: E402
+from modules.cache import RenderCache  # noqa: E402
+from modules.changer import Changer  # noqa: E402
+from modules.colors import NUMPY, Colors, sample, summarize  # noqa: E402
+from modules.engine import Engine  # noqa: E402
+from modules.models.models import Models  # noqa: E402
+from modules.system import Plan, System  # noqa: E402
+
+STYLES: Final[list[str]] = [
+    "center",
+    "combo/mosaic",
+    "fill/zoom",
+    "fit/scale",
+    "stretch",
+    "tile",
+]
+# styles that draw a filler under the image
+FILLED: Final[list[str]] = ["center", "fit/scale"]
+FILLERS: Final[dict[str, dict]] = {
+    "blank": {"mode": "blank", "blank": {"color": "Black"}},
+    "blank-mean": {"mode": "blank", "blank": {"color": "mean"}},
+    "blur": {"mode": "blur"},
+    "overlap": {"mode": "overlap"},
+}
+OVERLAYS: Final[list[str]] = ["file", "image", "system"]
+
+
+def commit() -> str:
+    result = subprocess.run(
+        ["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() or "unknown"
+
+
+def run(function: Callable, *args) -> object:
+    # calls a method that adds steps to a plan, then runs the plan
+    plan = Plan()
+    result = function(*args, plan)
+    plan.run()
+    return result
+
+
+def engines(requested: str) -> list[str]:
+    available = []
+    if shutil.which("magick") is not None:
+        available.append("magick")
+    if Engine({"engine": "pillow"}).available():
+        available.append("pillow")
+    return [e for e in available if requested in ["all", e]]
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace, work: str) -> None:
+        self.args = args
+        self.work = work
+        self.results: dict[str, dict] = {}
+        with open(os.path.join(ROOT, "changer.json"), "r") as f:
+            config = json.load(f)
+        config["catalog"] = os.path.join(work, "changer.db")
+        config["cache"]["enabled"] = False
+        config["prefetch"]["enabled"] = False
+        config.pop("daemon", None)
+        config["outputs"] = []
+        config["files"]["folders"] = [{"path": args.library, "recursive": True}]
+        config["files"]["trash"] = []
+        config["files"]["index"] = False
+        config["wallpaper"]["wallpaper"] = os.path.join(work, "wallpaper.jpeg")
+        for module in config["modules"]:
+            module["enabled"] = module["type"] in OVERLAYS
+            if module["type"] == "system":
+                module["file"] = os.path.join(work, "sysinfo.json")
+                module["lifetimes"] = {"external": 0}
+        self.config = config
+        self.changer = Changer(
+            os.path.join(ROOT, "changer.py"),
+            argparse.Namespace(command="bench", config="", debug=False),
+            [],
+        )
+        self.changer.config = config
+
+    def measure(
+        self,
+        name: str,
+        function: Callable[[], object],
+        setup: Callable[[], object] | None = None,
+    ) -> None:
+        if self.args.only is not None and not name.startswith(self.args.only):
+            return
+        times = []
+        for _ in range(self.args.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        self.results[name] = {
+            "runs": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.fmean(times),
+        }
+        print(f"{name:<44}{statistics.median(times) * 1000:>12.2f} ms", flush=True)
+
+    def reload(self, files: list[str]) -> None:
+        changer = self.changer
+        self.measure("reload/full", lambda: changer.__do_reload__(True))
+        self.measure("reload/unchanged", lambda: changer.__do_reload__())
+
+        def touch() -> None:
+            now = time.time()
+            for file in files[:: max(1, len(files) // 100)]:
+                os.utime(file, (now, now))
+
+        # about 1% of the library changed since the last reload
+        self.measure("reload/touched", lambda: changer.__do_reload__(), touch)
+        if "magick" in engines("all"):
+            catalog = changer.catalog
+            self.measure(
+                "index",
+                changer.__do_index__,
+                lambda: catalog.update_files(
+                    [(f, *stats) for f, stats in catalog.get_file_stats().items()]
+                ),
+            )
+
+    def select(self) -> None:
+        changer = self.changer
+
+        def pick() -> None:
+            for _ in range(100):
+                changer.__pick__()
+
+        self.measure("select/100", pick)
+
+    def colors(self, file: str) -> None:
+        # uncached, as for a file seen for the first time
+        if NUMPY:
+            self.measure("colors", lambda: summarize(sample(file)))
+        if shutil.which("identify") is not None:
+            self.measure(
+                "colors/identify",
+                lambda: subprocess.run(
+                    ["identify", "-verbose", file], capture_output=True, check=True
+                ),
+            )
+
+    def overlay(self, file: str) -> None:
+        # overlays are drawn by magick whatever the engine
+        changer = self.changer
+        self.config["wallpaper"]["file"] = file
+        output = {
+            "name": "",
+            "width": self.config["width"],
+            "height": self.config["height"],
+        }
+        for index, module in enumerate(self.config["modules"]):
+            if module["enabled"]:
+                layer = os.path.join(self.work, f"layer_{index}.png")
+                self.measure(
+                    f"overlay/{module['type']}",
+                    lambda: run(
+                        changer.__apply_module__,
+                        module,
+                        changer.__get_text__(module, "fill/zoom"),
+                        layer,
+                        output,
+                    ),
+                )
+
+    def render(self, engine: str, file: str) -> None:
+        changer = self.changer
+        wallpaper = self.config["wallpaper"]
+        self.config["engine"] = engine
+        changer.engine = Engine(self.config)
+        output = {
+            "name": "",
+            "width": self.config["width"],
+            "height": self.config["height"],
+            "wallpaper": wallpaper["wallpaper"],
+        }
+        box = (output["width"], output["height"])
+        self.measure(
+            f"source/{engine}", lambda: run(changer.__get_source__, file, None)
+        )
+        self.measure(
+            f"source/{engine}/reduced",
+            lambda: run(changer.__get_source__, file, box),
+        )
+        source = run(changer.__get_source__, file, None)
+        filler = wallpaper["filler"]
+        for style in STYLES:
+            for name, settings in FILLERS.items() if style in FILLED else [("", {})]:
+                wallpaper["filler"] = {**filler, **settings}
+                label = f"backdrop/{engine}/{style}" + (f"/{name}" if name else "")
+                self.measure(
+                    label,
+                    lambda: run(
+                        changer.__render_backdrop__, file, source, style, True, output
+                    ),
+                )
+            wallpaper["filler"] = filler
+        backdrop, _ = run(
+            changer.__render_backdrop__, file, source, "fill/zoom", True, output
+        )
+        # the layers drawn by overlay(), if magick is there
+        layers = [
+            os.path.join(self.work, file)
+            for file in sorted(os.listdir(self.work))
+            if file.startswith("layer_")
+        ]
+
+        def composite() -> None:
+            if changer.engine.available():
+                changer.engine.composite(backdrop, layers, output["wallpaper"])
+            else:
+                script = ["magick", backdrop]
+                for layer in layers:
+                    script += [layer, "-composite"]
+                subprocess.run([*script, output["wallpaper"]], check=True)
+
+        self.measure(f"composite/{engine}", composite)
+        changer.engine.images.clear()
+        changer.system.cleanup()
+
+    def startup(self) -> None:
+        # one-shot commands run in a fresh interpreter, as cron starts them
+        config = os.path.join(self.work, "changer.json")
+        with open(config, "w") as f:
+            json.dump(self.config, f)
+        env = {**os.environ, "XDG_CACHE_HOME": self.work}
+        program = [sys.executable, "-OO"]
+
+        def start(*args: str) -> Callable[[], object]:
+            return lambda: subprocess.run(
+                [*program, *args], cwd=ROOT, env=env, capture_output=True, check=True
+            )
+
+        self.measure("startup/import", start("-c", "import modules.changer"))
+        changer = os.path.join(ROOT, "changer.py")
+        self.measure("startup/version", start(changer, "version"))
+        self.measure("startup/count", start(changer, "-c", config, "count"))
+
+    def run(self) -> dict:
+        args = self.args
+        params = {
+            "count": args.count,
+            "sizes": args.sizes,
+            "formats": args.formats,
+            "depth": args.depth,
+            "seed": args.seed,
+        }
+        print(f"Generating library in {args.library}…", flush=True)
+        files = generate(args.library, **params)
+        with System(self.config) as self.changer.system:
+            with Models(self.config["catalog"]) as self.changer.catalog:
+                self.changer.cache = RenderCache(self.config, self.changer.catalog)
+                self.changer.colors = Colors(self.changer.catalog)
+                self.changer.engine = Engine(self.config)
+                self.reload(files)
+                self.startup()
+                self.select()
+                self.colors(files[0])
+                if shutil.which("magick") is not None:
+                    self.overlay(files[0])
+                for engine in engines(args.engine):
+                    self.render(engine, files[0])
+        return {
+            "commit": commit(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "library": params,
+            "repeat": args.repeat,
+            "results": self.results,
+        }
+
+
+def compare(base_file: str, head_file: str, threshold: float) -> int:
+    with open(base_file, "r") as f:
+        base = json.load(f)
+    with open(head_file, "r") as f:
+        head = json.load(f)
+    if base["library"] != head["library"]:
+        print("Warning: the libraries differ, timings may not be comparable.")
+    print(f"{'':<44}{base['commit']:>12}{head['commit']:>12}{'change':>10}")
+    regressions = 0
+    for name, result in head["results"].items():
+        if name not in base["results"]:
+            continue
+        before = base["results"][name]["median"]
+        after = result["median"]
+        change = after / before - 1 if before > 0 else 0
+        mark = ""
+        if change > threshold:
+            mark = " !"
+            regressions += 1
+        print(
+            f"{name:<44}{before * 1000:>10.2f}ms{after * 1000:>10.2f}ms{change:>+10.1%}{mark}"
+        )
+    return 1 if regressions > 0 else 0
+
+
+def parse() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="bench")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument("--count", type=int, default=DEFAULTS["count"])
+    run.add_argument("--sizes", nargs="+", default=DEFAULTS["sizes"])
+    run.add_argument("--formats", nargs="+", default=DEFAULTS["formats"])
+    run.add_argument("--depth", type=int, default=DEFAULTS["depth"])
+    run.add_argument("--seed", type=int, default=DEFAULTS["seed"])
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--engine", choices=["all", "magick", "pillow"], default="all")
+    run.add_argument(
+        "--library", default=os.path.join(tempfile.gettempdir(), "changer_bench")
+    )
+    run.add_argument("--only", help="run only benchmarks starting with this prefix")
+    run.add_argument("--output", help="results file (default: results/<commit>.json)")
+    diff = commands.add_parser("compare", help="compare two results files")
+    diff.add_argument("base")
+    diff.add_argument("head")
+    diff.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slowdown reported as a regression (default=0.1)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse()
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == "compare":
+        sys.exit(compare(args.base, args.head, args.threshold))
+    with tempfile.TemporaryDirectory(prefix="changer_bench_") as work:
+        report = Bench(args, work).run()
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {output}")
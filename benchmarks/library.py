@@ -0,0 +1,86 @@
+# benchmarks/library.py
+
+import json
+import os
+import random
+import shutil
+import subprocess
+from typing import Final
+
+try:
+    from PIL import Image
+except ImportError:  # magick draws the images instead
+    Image = None
+
+DEFAULTS: Final[dict] = {
+    "count": 200,
+    "sizes": ["1920x1080", "3840x2160", "1080x1920", "800x600"],
+    "formats": ["jpg", "png", "webp"],
+    "depth": 2,
+    "seed": 42,
+}
+MANIFEST: Final[str] = "library.json"
+
+
+def folder(root: str, index: int, depth: int, rng: random.Random) -> str:
+    # files are spread over a tree with up to four folders per level
+    parts = [f"d{rng.randrange(4)}" for _ in range(index % (depth + 1))]
+    return os.path.join(root, *parts)
+
+
+def draw(file: str, width: int, height: int, rng: random.Random) -> None:
+    start = tuple(rng.randrange(256) for _ in range(3))
+    end = tuple(rng.randrange(256) for _ in range(3))
+    if Image is None:
+        colors = "-".join(
+            "#" + "".join(f"{c:02x}" for c in color) for color in [start, end]
+        )
+        subprocess.run(
+            ["magick", "-size", f"{width}x{height}", f"gradient:{colors}", file],
+            check=True,
+        )
+        return
+    # a gradient with some noise compresses about as well as a photograph
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width // 4, height // 4), 24).resize((width, height))
+    image = Image.merge(
+        "RGB",
+        [
+            Image.blend(gradient, noise, 0.3).point(
+                lambda v, a=a, b=b: a + (b - a) * v // 255
+            )
+            for a, b in zip(start, end)
+        ],
+    )
+    image.save(file, quality=90, compress_level=1)
+
+
+def generate(root: str, **params) -> list[str]:
+    """Creates a synthetic image library under root and returns its files.
+
+    The same parameters always produce the same library, which is kept
+    until they change.
+    """
+    params = {**DEFAULTS, **params}
+    manifest = os.path.join(root, MANIFEST)
+    try:
+        with open(manifest, "r") as f:
+            saved = json.load(f)
+        if saved["params"] == params and all(map(os.path.isfile, saved["files"])):
+            return saved["files"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    shutil.rmtree(root, ignore_errors=True)
+    rng = random.Random(params["seed"])
+    files: list[str] = []
+    for index in range(params["count"]):
+        width, height = map(int, rng.choice(params["sizes"]).split("x"))
+        path = folder(root, index, params["depth"], rng)
+        os.makedirs(path, exist_ok=True)
+        extension = params["formats"][index % len(params["formats"])]
+        file = os.path.join(path, f"image{index:06d}.{extension}")
+        draw(file, width, height, rng)
+        files.append(file)
+    with open(manifest, "w") as f:
+        json.dump({"params": params, "files": files}, f)
+    return files
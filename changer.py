@@ -29,6 +29,12 @@ def parse() -> tuple[argparse.Namespace, list[str]]:
     parser.add_argument(
         "-d", "--debug", help="enable debugging mode", action="store_true"
     )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        help="time each stage, appending the spans to /tmp/changer_profile.jsonl and printing a summary",
+        action="store_true",
+    )
     parser.add_argument(
         "-v",
         "--version",
@@ -17,10 +17,21 @@ deploy() {
 }
 
 deploy changer.py $1
+deploy modules/cache.py $1/modules
 deploy modules/changer.py $1/modules
+deploy modules/colors.py $1/modules
+deploy modules/config.py $1/modules
+deploy modules/convert.py $1/modules
+deploy modules/daemon.py $1/modules
+deploy modules/desktop.py $1/modules
+deploy modules/engine.py $1/modules
+deploy modules/metadata.py $1/modules
+deploy modules/profile.py $1/modules
+deploy modules/sysinfo.py $1/modules
 deploy modules/system.py $1/modules
+deploy modules/watcher.py $1/modules
+deploy modules/weather.py $1/modules
 deploy modules/models/models.py $1/modules/models
 deploy modules/models/db/sqlite.py $1/modules/models/db
 deploy scripts/desktop.sh $1/scripts
-deploy scripts/sysinfo.sh $1/scripts
 deploy scripts/wallpaper.sh $1/scripts
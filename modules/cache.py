@@ -0,0 +1,71 @@
+# modules/cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from dataclasses import dataclass
+
+from modules.models.models import Models
+
+
+@dataclass
+class RenderCache:
+    config: dict
+    catalog: Models
+
+    def enabled(self) -> bool:
+        return "cache" in self.config and self.config["cache"]["enabled"]
+
+    def get(self, key: str) -> str | None:
+        file = self.catalog.get_cache_entry(key)
+        if file is None:
+            return None
+        if not os.path.isfile(file) or os.path.getsize(file) == 0:
+            # an empty file is what a failed render leaves behind
+            logging.warning(f"Dropping unusable cached render {file}")
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            self.catalog.remove_cache_entries([key])
+            return None
+        self.catalog.touch_cache_entry(key, time.time())
+        logging.debug(f"Cache hit: {file}")
+        return file
+
+    def key(self, *parts) -> str:
+        text = json.dumps(parts, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def put(self, key: str, source: str) -> str | None:
+        if os.path.getsize(source) == 0:
+            logging.warning(f"Not caching empty render {source}")
+            return None
+        path = os.path.expanduser(self.config["cache"]["path"])
+        os.makedirs(path, exist_ok=True)
+        file = os.path.join(path, key + os.path.splitext(source)[1])
+        shutil.copyfile(source, file)
+        self.catalog.add_cache_entry(key, file, os.path.getsize(file), time.time())
+        self.evict()
+        return file
+
+    def evict(self) -> None:
+        budget = self.config["cache"]["size"] * 1024 * 1024
+        total = self.catalog.get_cache_size()
+        if total <= budget:
+            return
+        evicted: list[str] = []
+        for key, file, size in self.catalog.get_cache_entries():
+            if total <= budget:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            evicted.append(key)
+            total -= size
+        logging.debug(f"Evicted {len(evicted)} cached renders")
+        self.catalog.remove_cache_entries(evicted)
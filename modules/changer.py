@@ -1,7 +1,7 @@
 # modules/changer.py
 
 import argparse
-import glob
+import fcntl
 import json
 import logging
 import os
@@ -10,58 +10,220 @@ import secrets
 import sys
 import time
 from dataclasses import dataclass
-from typing import Final
+from functools import cached_property
+from typing import TYPE_CHECKING, Final
 
+from modules.cache import RenderCache
+from modules.config import ConfigError, load
 from modules.models.models import Models
-from modules.system import Script, System, execute
+from modules.profile import PROFILER, span
+from modules.system import Plan, Step, System, execute, pool_map, scan, spawn
 
-COPYRIGHT: Final[str] = "Copyright © 2024-2026 Jose Tafla. All rights reserved."
-
-
-@dataclass
-class Exceptions:
-    exceptions: dict
+# the other modules are imported by the commands that use them, so a one-shot
+# command only pays for what it runs
+if TYPE_CHECKING:
+    from modules.colors import Colors
+    from modules.engine import Engine
+    from modules.watcher import Watcher
 
-    def add_rule(self, filename: str, exception: str) -> None:
-        if filename not in self.exceptions:
-            self.exceptions[filename] = []
-        self.exceptions[filename].append(exception)
-
-    def clear_exception(self, filename: str) -> None:
-        if filename in self.exceptions:
-            del self.exceptions[filename]
-
-    def get_rules(self, filename: str) -> list[str] | None:
-        return self.exceptions[filename] if filename in self.exceptions else None
+COPYRIGHT: Final[str] = "Copyright © 2024-2026 Jose Tafla. All rights reserved."
+STYLES: Final[list[str]] = [
+    "center",
+    "default",
+    "combo",
+    "fill",
+    "fit",
+    "mosaic",
+    "scale",
+    "stretch",
+    "tile",
+    "zoom",
+]
+# styles that scale the image to the screen, so it can be decoded smaller
+RESIZED: Final[list[str]] = ["combo/mosaic", "fill/zoom", "fit/scale", "stretch"]
+# seconds a layer that does not depend on the current image stays valid
+LAYER_TTL: Final[dict[str, int]] = {"system": 300}
+FORWARDED: Final[list[str]] = ["delete", "next", "reload", "skip", *STYLES]
 
 
 @dataclass(init=False)
 class Changer:
+    program: str
     args: argparse.Namespace
     extra: list[str]
     config: dict
     system: System
-    exceptions: Exceptions
     catalog: Models
+    cache: RenderCache
 
     def __init__(self, cmd: str, args: argparse.Namespace, extra: list[str]) -> None:
+        self.program = os.path.abspath(cmd)
         os.chdir(cmd[: cmd.rfind("/")])
         logging.debug(f"Running from {os.getcwd()}")
         self.args = args
         self.extra = extra
 
+    @cached_property
+    def colors(self) -> "Colors":
+        from modules.colors import Colors
+
+        return Colors(self.catalog)
+
+    @cached_property
+    def engine(self) -> "Engine":
+        from modules.engine import Engine
+
+        return Engine(self.config)
+
+    def __dispatch__(self, command: str, version: str) -> int:
+        exit_code: int = 0
+        with span(f"command:{command}"):
+            try:
+                if command == "commands" or command == "help":
+                    self.__help__(version)
+                elif command == "convert":
+                    self.__do_convert__()
+                elif command == "count":
+                    self.__get_count__(True)
+                elif command == "daemon":
+                    self.__do_daemon__(version)
+                elif command == "delete":
+                    self.__do_delete__()
+                elif command == "export":
+                    self.__do_export__()
+                elif command == "index":
+                    self.__do_index__()
+                elif command == "next":
+                    self.__do_next__()
+                elif command == "prefetch":
+                    self.__do_prefetch__()
+                elif command == "reload":
+                    self.__do_reload__("full" in self.extra)
+                elif command == "skip":
+                    self.__do_skip__()
+                elif command == "version":
+                    self.__do_version__(version)
+                elif command == "watch":
+                    self.__do_watch__()
+                elif command == "weather":
+                    self.__do_weather__()
+                elif command in STYLES:
+                    self.__do_style__(command)
+                else:
+                    print(f"Unknown command: {command}")
+                    exit_code = 3
+            except Exception as e:
+                logging.exception(e, exc_info=True, stack_info=True)
+                exit_code = 1
+        return exit_code
+
+    def __get_identity__(self, filename: str) -> list:
+        # renders are keyed by content once it is fingerprinted, so copies
+        # of a file share them
+        digest = self.catalog.get_digest(filename)
+        if digest is not None:
+            return [digest]
+        info = os.stat(filename)
+        return [filename, info.st_size, info.st_mtime_ns]
+
+    def __get_layer__(
+        self, index: int, module: dict, style: str, output: dict
+    ) -> tuple[str, str | None]:
+        """Returns the layer of a module on an output, along with the key to
+        record once it is rendered again, or None if it is still valid."""
+        name = f"{output['name']}_" if len(output["name"]) > 0 else ""
+        layer = f"/tmp/changer_layer_{name}{index}.png"
+        parts = [module, output["width"], output["height"]]
+        if module["type"] in ["file", "image"]:
+            parts += [self.config["wallpaper"]["file"], style]
+        elif module["type"] == "weather":
+            from modules.weather import Weather
+
+            parts.append(os.path.getmtime(Weather(module, self.system).panel()))
+        ttl = module.get("ttl", LAYER_TTL.get(module["type"], 0))
+        key = self.cache.key(*parts)
+        state = self.catalog.get_state(layer)
+        if state is not None and os.path.isfile(layer):
+            saved, rendered = state.split()
+            if saved == key and (ttl == 0 or time.time() - float(rendered) < ttl):
+                logging.debug(f"Reusing {module['type']} layer {layer}")
+                return layer, None
+        return layer, key
+
+    def __get_outputs__(self) -> list[dict]:
+        """Returns the monitors to render, each with its own wallpaper file.
+
+        Without an "outputs" list there is a single unnamed output sized by
+        width and height, which the desktop spans across every monitor.
+        """
+        wallpaper = self.config["wallpaper"]["wallpaper"]
+        outputs = self.config.get("outputs", [])
+        if len(outputs) == 0:
+            return [
+                {
+                    "name": "",
+                    "width": self.config["width"],
+                    "height": self.config["height"],
+                    "wallpaper": wallpaper,
+                }
+            ]
+        root, extension = os.path.splitext(wallpaper)
+        return [
+            {**output, "wallpaper": f"{root}_{output['name']}{extension}"}
+            for output in outputs
+        ]
+
+    def __get_text__(self, module: dict, style: str) -> str:
+        """Returns what a module writes, which is the same on every output."""
+        from modules.metadata import human
+        from modules.sysinfo import SysInfo
+
+        filename = self.config["wallpaper"]["file"]
+        if module["type"] == "file":
+            return filename.replace("\\", "/").replace("/", "\\n")
+        elif module["type"] == "image":
+            metadata = self.catalog.get_metadata(filename)
+            if metadata is None:
+                _, result, _ = execute(
+                    ["identify", "-format", "%w|%h|%k|%b|%[exif:DateTime]", filename]
+                )
+                params = result.split("|")
+            else:
+                width, height, _, size, colors, exif = metadata
+                params = [width, height, colors, human(size), exif or ""]
+            info = f"{style}\\n{params[0]} x {params[1]}\\nRatio: {int(params[0]) / int(params[1])}\\n{params[2]} colors\\n{params[3]}"
+            return f"{info}\\n{params[4]}" if len(params[4]) > 0 else info
+        elif module["type"] == "system":
+            sysinfo = self.system.create_temp_file(suffix=".txt", mode="w")
+            with open(sysinfo, "w") as f:
+                f.write(SysInfo(module).collect())
+            return f"@{sysinfo}"
+        return ""  # weather layers show their own panel
+
     def __help__(self, version: str) -> None:
         self.__do_version__(version)
         print("""Commands:
 =========
 commands         Presents this list and exits.
-convert <image>  Converts <image> to different formats so it can be presented on a blog.
+convert <image>… Converts each <image> (files or glob patterns) to different formats so it
+                 can be presented on a blog, in parallel and skipping those up to date.
 count            Shows the number of files on the repository and exits.
+daemon           Stays resident, changing the wallpaper every daemon.interval seconds and
+                 accepting commands on the daemon.socket Unix socket (one per line,
+                 e.g. "echo next | nc -U <socket>"; "stop" ends the daemon). While it
+                 runs, next, skip, delete, reload and the styles are handed to it.
 delete           Deletes the current wallpaper from the repository.
+export           Writes rules, history and the current wallpaper back to the configuration file.
+index            Extracts image properties for files not indexed yet (reload does it too).
 next             Changes the wallpaper, setting it to the predefined style.
-reload           Reloads all pictures according to the configuration.
+prefetch         Chooses the upcoming wallpapers and renders their backdrops in advance.
+reload [full]    Reloads pictures according to the configuration, applying only
+                 what changed on disk ("full" rebuilds the repository from scratch).
 skip             Removes the current wallpaper from the sequence (without deleting it).
 version          Displays the current program version and exits.
+watch            Catches up with the folders, then applies files added, moved or removed
+                 as they happen (the daemon does it too if files.watch is enabled).
+weather          Refreshes the weather panels whose data is older than their ttl.
 <style>          Defines the style for the current wallpaper:
   center
   combo | mosaic
@@ -72,175 +234,97 @@ version          Displays the current program version and exits.
   tile""")
 
     def __apply_module__(
-        self, module: dict, style: str, fore: Script, back: Script
-    ) -> None:
-        filename = self.config["wallpaper"]["file"]
-        command = f"  -font {module['font']} -pointsize {module['size']} -gravity {module['gravity']}"
-        if module["type"] == "file":
-            name = filename.replace("\\", "/").replace("/", "\\n")
-            fore.append(f"{command} -stroke none -fill {module['color']} \\")
-            back.append(f"{command} -strokewidth 2 -stroke {module['shadow']} \\")
-            command = f'    -annotate {module["geometry"]} "{name}" \\'
-            fore.append(command)
-            back.append(command)
-        elif module["type"] == "image":
-            script = Script(self.system)
-            script.append(
-                f"identify -format '%w|%h|%k|%b|%[exif:DateTime]' \"{filename}\""
+        self, module: dict, text: str, layer: str, output: dict, plan: Plan
+    ) -> Step:
+        canvas = [
+            "magick",
+            "-size",
+            f"{output['width']}x{output['height']}",
+            "canvas:none",
+        ]
+        if module["type"] == "weather":
+            return plan.add(
+                [
+                    *canvas,
+                    *["-gravity", module["gravity"], module["file"]],
+                    *["-geometry", module["geometry"], "-composite", layer],
+                ],
+                label=f"overlay:{module['type']}",
             )
-            _, result, _ = script.run()
-            params = result.split("|")
-            info = f"{style}\\n{params[0]} x {params[1]}\\nRatio: {int(params[0]) / int(params[1])}\\n{params[2]} colors\\n{params[3]}"
-            info = f"{info}\\n{params[4]}" if len(params[4]) > 0 else info
-            fore.append(f"{command} -stroke none -fill {module['color']} \\")
-            back.append(f"{command} -strokewidth 2 -stroke {module['shadow']} \\")
-            command = f"    -annotate {module['geometry']} '{info}' \\"
-            fore.append(command)
-            back.append(command)
-        elif module["type"] == "system":
-            sysinfo = self.system.create_temp_file(suffix=".txt", mode="w")
-            execute(["./scripts/sysinfo.sh", sysinfo, module["file"], module["token"]])
-            fore.append(f"{command} -stroke none -fill {module['color']} \\")
-            back.append(f"{command} -strokewidth 2 -stroke {module['shadow']} \\")
-            command = f"    -annotate {module['geometry']} @{sysinfo} \\"
-            fore.append(command)
-            back.append(command)
-        elif module["type"] == "weather":
-            file = module["file"]
-            if not os.path.isfile(file):
-                self.__display_weather__(module)
-            fore.append(
-                f"  -gravity {module['gravity']} {file} -geometry {module['geometry']} -composite \\"
-            )
-
-    def __display_weather__(self, module: dict) -> None:
-        location = module["location"]
-        logging.info(f"Loading weather information for {location}")
-        script = Script(self.system)
-        script.append(
-            f"curl --silent 'https://api.openweathermap.org/data/2.5/weather?{location}&appid={module['appid']}'"
-        )
-        _, result, _ = script.run()
-        data = json.loads(result)
-        info = self.system.create_temp_file(suffix=".txt", mode="w")
-        with open(info, "w") as f:
-            f.write(f"{data['name']} - {data['sys']['country']}\n")
-            f.write(time.ctime(data["dt"]) + "\n")
-            w = data["weather"][0]
-            f.write(f"{w['main']} ({w['description']})\n")
-            c = data["main"]["temp"] - 273.15
-            f.write("{:.1f}°F = {:.1f}°C\n".format(c * 9 / 5 + 32, c))
-            f.write(f"Cloudiness: {data['clouds']['all']}%\n")
-            f.write(f"Humidity: {data['main']['humidity']}%\n")
-            if "visibility" in data:
-                v = data["visibility"]
-                f.write(
-                    "Visibility: {:.2f} mi = {:.2f} km\n".format(v / 1609, v / 1000)
-                )
-            wind = data["wind"]["speed"]
-            deg = data["wind"]["deg"]
-            direction = (
-                "N"
-                if deg > 348.75
-                else "NNW"
-                if deg > 326.75
-                else "NW"
-                if deg > 303.75
-                else "WNW"
-                if deg > 281.25
-                else "W"
-                if deg > 258.75
-                else "WSW"
-                if deg > 216.25
-                else "SW"
-                if deg > 213.75
-                else "SSW"
-                if deg > 191.25
-                else "S"
-                if deg > 168.75
-                else "SSE"
-                if deg > 146.25
-                else "SE"
-                if deg > 123.75
-                else "ESE"
-                if deg > 101.25
-                else "E"
-                if deg > 78.75
-                else "ENE"
-                if deg > 56.25
-                else "NE"
-                if deg > 33.75
-                else "NNE"
-                if deg > 11.25
-                else "N"
-            )
-            f.write(
-                "Wind: {:.1f} mph = {:.1f} km/h {}\n".format(
-                    wind * 2.23694, wind * 3.6, direction
-                )
-            )
-        script.reset()
-        icon = self.system.create_temp_file(suffix=".png")
-        script.append(
-            f"curl --output {icon} --silent 'http://openweathermap.org/img/wn/{w['icon']}@2x.png'"
-        )
-        blur = self.system.create_temp_file(suffix=".png")
-        script.append(
-            f"magick {icon} -resize 110% -fill Black -colorize 50% -channel RGBA -blur 2x2 {blur}"
-        )
-        full = self.system.create_temp_file(suffix=".png")
-        script.append(
-            f"magick -size 100x100 canvas:#ffffff40 -gravity Center {blur} -composite {icon} -composite {full}"
-        )
-        script.append(
-            f"magick -size 1024x640 canvas:none -font {module['font']} -pointsize {module['size']} -gravity {module['gravity']} \\"
-        )
-        script.append(
-            f"  -stroke {module['shadow']} -strokewidth 2 -annotate {module['offset']} @{info} \\"
-        )
-        script.append("  -channel RGBA -blur 2x2 \\")
-        script.append(
-            f"  -stroke none -fill {module['color']} -annotate {module['offset']} @{info} \\"
+        font = ["-font", module["font"], "-pointsize", module["size"]]
+        font += ["-gravity", module["gravity"]]
+        # the shadow is blurred first and the text drawn over it, which takes
+        # a single magick: drawing them apart would cost an extra composite
+        return plan.add(
+            [
+                *canvas,
+                *font,
+                *["-strokewidth", 2, "-stroke", module["shadow"]],
+                *["-annotate", module["geometry"], text],
+                *["-channel", "RGBA", "-blur", "2x2", "+channel"],
+                *font,
+                *["-stroke", "none", "-fill", module["color"]],
+                *["-annotate", module["geometry"], text],
+                layer,
+            ],
+            label=f"overlay:{module['type']}",
         )
-        script.append(f"  {full} -composite \\")
-        script.append(f"  {module['file']}")
-        script.run()
 
     def __do_convert__(self) -> None:
         if len(self.extra) == 0:
             logging.fatal("Please include name of image file to be converted.")
+            return
+        from modules.convert import convert, expand, stale
+
+        files = expand(self.extra)
+        blur = self.config["wallpaper"]["filler"]["blur"]
+        jobs: list[tuple[str, list[str], str]] = []
+        for file in files:
+            if not os.path.isfile(file):
+                logging.error(f"Cannot convert {file}: file not found")
+                print(f"{file}: file not found")
+                continue
+            variants = stale(file)
+            if len(variants) == 0:
+                logging.info(f"{file} is up to date")
+            else:
+                jobs.append((file, variants, blur))
+        print(f"Converting {len(jobs)} of {len(files)} files")
+        if len(jobs) == 0:
+            return
+        workers = self.config["files"].get("workers", os.cpu_count() or 1)
+        logging.info(f"Converting {len(jobs)} files with {workers} workers")
+        # each file is decoded once, by a single magick writing all variants
+        results = pool_map(convert, jobs, min(workers, len(jobs)))
+        for done, (job, error) in enumerate(results, 1):
+            file, variants, _ = job
+            if error is None:
+                logging.info(f"Converted {file} to {', '.join(variants)}")
+                print(f"[{done}/{len(jobs)}] {file}: {', '.join(variants)}", flush=True)
+            else:
+                logging.error(f"Cannot convert {file}: {error}")
+                print(f"[{done}/{len(jobs)}] {file}: {error}", flush=True)
+
+    def __do_daemon__(self, version: str) -> None:
+        from modules.daemon import Daemon
+
+        def request(command: str, extra: list[str]) -> int:
+            self.extra = extra
+            try:
+                return self.__dispatch__(command, version)
+            finally:
+                if self.__pillow__():
+                    self.engine.images.clear()
+                self.system.cleanup()
+                PROFILER.report()
+
+        if self.config["files"].get("watch", {}).get("enabled", False):
+            with self.__watcher__() as watcher:
+                # catches up with what changed while nothing was watching
+                self.__do_reload__()
+                Daemon(self.config["daemon"], request, watcher).run()
         else:
-            input_file = self.extra[0]
-            logging.debug(f"Converting {input_file}")
-            script = Script(self.system)
-            oriented = self.system.create_temp_file(suffix=".png")
-            script.append(f'magick "{input_file}" -auto-orient {oriented}')
-            script.append(f"identify -format '%h' \"{oriented}\"")
-            _, result, _ = script.run()
-            height = int(result)
-            width = round(height * 16 / 9)
-            logging.info(f"Resizing to {width}×{height}")
-            script.reset()
-            script.append(
-                f"magick -size {width}x{height} canvas:none -gravity Center \\"
-            )
-            script.append(f"  {oriented} -resize {width} -composite \\")
-            script.append(
-                f"  -channel RGBA -blur {self.config['wallpaper']['filler']['blur']} \\"
-            )
-            script.append(f"  {oriented} -composite \\")
-            script.append(f'  "{input_file}.blurred.jpeg"')
-            script.append(
-                f"magick -size {width}x{height} canvas:{self.__get_base_color__('mean', oriented)} -gravity Center \\"
-            )
-            script.append(f"  {oriented} -composite \\")
-            script.append(f'  "{input_file}.mean.jpeg"')
-            script.append(
-                f"magick -size {width}x{height} canvas:{self.__get_base_color__('median', oriented)} -gravity Center \\"
-            )
-            script.append(f"  {oriented} -composite \\")
-            script.append(f'  "{input_file}.median.jpeg"')
-            script.run()
+            Daemon(self.config["daemon"], request).run()
 
     def __do_delete__(self) -> None:
         filename = self.config["wallpaper"]["file"]
@@ -249,55 +333,144 @@ version          Displays the current program version and exits.
             os.remove(filename)
         except FileNotFoundError | IsADirectoryError:
             pass
-        self.exceptions.clear_exception(filename)
+        self.catalog.set_rule(filename, False, None)
         self.__do_reload__()
         self.__do_next__()
 
+    def __do_export__(self) -> None:
+        wallpaper = self.config["wallpaper"]
+        wallpaper["exceptions"] = {
+            filename: ([style] if style is not None else [])
+            + (["skip"] if skip else [])
+            for filename, (skip, style) in self.catalog.get_rules().items()
+        }
+        wallpaper["history"] = [
+            {"file": filename, "style": style, "shown": shown}
+            for filename, style, shown in self.catalog.get_history()
+        ]
+        file = self.args.config
+        logging.info(f"Exporting rules and history to {file}")
+        try:
+            os.replace(file, file + ".bak")
+        except FileNotFoundError:
+            pass
+        with open(file, "w") as f:
+            json.dump(self.config, f, indent=2)
+
+    def __do_index__(self) -> None:
+        from modules.metadata import extract
+
+        # only files without metadata are pending, so an interrupted run
+        # resumes where the last committed batch ended
+        pending = self.catalog.get_unindexed()
+        batch = self.config["files"].get("batch", 1000)
+        workers = self.config["files"].get("workers", os.cpu_count() or 1)
+        if len(pending) > 0:
+            logging.info(f"Indexing {len(pending)} files with {workers} workers")
+            rows: list[tuple] = []
+            done = 0
+            for file, metadata in pool_map(extract, pending, workers):
+                rows.append((file, *metadata))
+                if len(rows) == batch:
+                    self.catalog.set_metadata(rows)
+                    done += len(rows)
+                    rows = []
+                    logging.info(f"Indexed {done} of {len(pending)} files")
+            self.catalog.set_metadata(rows)
+            logging.info(f"Indexed {len(pending)} files")
+        self.__fingerprint__(batch, workers)
+
     def __do_next__(self) -> None:
-        total: int = self.__get_count__()
-        if total == 0:
-            logging.info("Repository is empty. Recreating…")
-            self.__do_reload__()
-            total = self.__get_count__()
-        exception = True
-        while True:
-            n = secrets.randbelow(total)
-            filename = self.catalog.get_nth_file(n)
-            rules = self.exceptions.get_rules(filename)
-            logging.debug(f"Rules for {filename}: {rules}")
-            if rules is None:
-                style = self.config["wallpaper"]["render"]
-                exception = False
-                break
-            elif "skip" in rules:
-                logging.info(f"Skipping #{n}: {filename}")
-                continue
+        prefetching = self.__prefetching__()
+        with span("select"):
+            choice = self.catalog.pop_queue() if prefetching else None
+            if choice is not None:
+                logging.info(f"Prefetched: {choice[0]}")
             else:
-                style = rules[-1]
-                logging.info(f"Custom style: {style}")
-                break
-        logging.info(f"{n}: {filename}")
-        self.config["wallpaper"]["file"] = filename
+                choice = self.__pick__()
+        if choice is None:
+            return
+        filename, style = choice
+        exception = style is not None
+        if exception:
+            logging.info(f"Custom style: {style}")
+        else:
+            style = self.config["wallpaper"]["render"]
+        self.__set_current__(filename, style if exception else None)
         self.__set_wallpaper__(style, exception)
+        if prefetching:
+            self.__spawn__("prefetch")
+
+    def __do_prefetch__(self) -> None:
+        if not self.__prefetching__():
+            logging.warning("Prefetching requires both prefetch and cache enabled.")
+            return
+        with open("/tmp/changer_prefetch.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logging.info("Prefetch already running")
+                return
+            queued = self.catalog.get_queue_length()
+            for _ in range(self.config["prefetch"]["count"] - queued):
+                choice = self.__pick__()
+                if choice is None:
+                    break
+                self.catalog.push_queue(choice[0])
+            for filename, style in self.catalog.get_queue():
+                exception = style is not None
+                if not exception:
+                    style = self.config["wallpaper"]["render"]
+                try:
+                    plan = Plan()
+                    self.__set_backdrops__(
+                        filename, style, exception, self.__get_outputs__(), plan
+                    )
+                    plan.run()
+                except Exception as e:
+                    logging.warning(f"Cannot prefetch {filename}: {e}")
 
-    def __do_reload__(self) -> None:
+    def __do_reload__(self, full: bool = False) -> None:
         pattern = re.compile(self.config["files"]["type"], re.IGNORECASE)
         folders = self.config["files"]["folders"]
+        batch = self.config["files"].get("batch", 1000)
         self.catalog.begin()
-        self.catalog.reset_repo()
+        if full:
+            self.catalog.reset_repo()
+        known = self.catalog.get_file_stats()
+        inserted: list[tuple[str, int, int]] = []
+        updated: list[tuple[str, int, int]] = []
+        found: set[str] = set()
         for folder in folders:
-            path = folder["path"] + "**"
-            all_files = glob.glob(path, recursive=folder["recursive"])
-            for filename in all_files:
-                if os.path.isfile(filename) and re.match(pattern, filename) is not None:
-                    self.catalog.add_to_repo(filename)
+            for filename, size, mtime in scan(
+                folder["path"], folder["recursive"], pattern
+            ):
+                if filename in found:
+                    continue
+                found.add(filename)
+                if filename not in known:
+                    inserted.append((filename, size, mtime))
+                elif known[filename] != (size, mtime):
+                    updated.append((filename, size, mtime))
+        deleted = [filename for filename in known if filename not in found]
+        for i in range(0, len(deleted), batch):
+            self.catalog.remove_files(deleted[i : i + batch])
+        for i in range(0, len(updated), batch):
+            self.catalog.update_files(updated[i : i + batch])
+        for i in range(0, len(inserted), batch):
+            self.catalog.add_files(inserted[i : i + batch])
         self.catalog.commit()
+        logging.info(
+            f"Reload: {len(inserted)} added, {len(updated)} updated, {len(deleted)} removed"
+        )
         self.__get_count__(True)
+        self.__analyze__()
 
     def __do_skip__(self) -> None:
         filename = self.config["wallpaper"]["file"]
         logging.info(f"Skipping {filename}")
-        self.exceptions.add_rule(filename, "skip")
+        _, style = self.catalog.get_rule(filename) or (False, None)
+        self.catalog.set_rule(filename, True, style)
         self.__do_next__()
 
     def __do_style__(self, style: str) -> None:
@@ -313,33 +486,115 @@ version          Displays the current program version and exits.
             else style
         )
         logging.info(f"New rule for {filename}: {style}")
+        skip, _ = self.catalog.get_rule(filename) or (False, None)
         if style == "default":
-            self.exceptions.clear_exception(filename)
+            self.catalog.set_rule(filename, skip, None)
             style = self.config["wallpaper"]["render"]
             exception = False
         else:
-            self.exceptions.add_rule(filename, style)
+            self.catalog.set_rule(filename, skip, style)
+        self.catalog.add_history(filename, style if exception else None)
         self.__set_wallpaper__(style, exception)
 
+    def __do_watch__(self) -> None:
+        with self.__watcher__() as watcher:
+            # catches up with what changed while nothing was watching
+            self.__do_reload__()
+            watcher.run()
+
+    def __do_weather__(self) -> None:
+        with open("/tmp/changer_weather.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logging.info("Weather refresh already running")
+                return
+            from modules.weather import Weather
+
+            for module in self.config["modules"]:
+                if module["enabled"] and module["type"] == "weather":
+                    weather = Weather(module, self.system)
+                    if weather.is_stale():
+                        weather.refresh()
+
     def __do_version__(self, version: str) -> None:
         print(f"{sys.argv[0]} {version}")
         print(COPYRIGHT)
 
+    def __import_config__(self) -> None:
+        # rules and history used to be kept in the configuration file itself
+        wallpaper = self.config["wallpaper"]
+        logging.info("Importing rules and history from the configuration file")
+        self.catalog.begin()
+        for filename, rules in wallpaper.get("exceptions", {}).items():
+            styles = [rule for rule in rules if rule != "skip"]
+            self.catalog.set_rule(
+                filename, "skip" in rules, styles[-1] if styles else None
+            )
+        for entry in wallpaper.get("history", []):
+            if isinstance(entry, str):
+                self.catalog.add_history(entry, None)
+            else:
+                self.catalog.add_history(entry["file"], entry.get("style"))
+        if len(wallpaper["file"]) > 0:
+            self.catalog.set_state("file", wallpaper["file"])
+        self.catalog.set_state("imported", "1")
+        self.catalog.commit()
+
     def __get_base_color__(self, keyword: str, input_file: str | None = None) -> str:
-        script = Script(self.system)
         input_file = (
             self.config["wallpaper"]["file"] if input_file is None else input_file
         )
-        script.append(f"identify -verbose '{input_file}' | \\")
-        script.append(f" command grep {keyword} | \\")
-        script.append("  awk '{print $2}'")
-        _, result, _ = script.run()
-        components = result.split("\n")
+        return self.colors.get(input_file, keyword)
+
+    def __watcher__(self) -> "Watcher":
+        from modules.watcher import Watcher
+
+        files = self.config["files"]
+        return Watcher(
+            files,
+            self.catalog,
+            self.__do_reload__,
+            self.__analyze__,
+        )
 
-        def __hex__(i: int) -> str:
-            return ("0" + hex(round(float(components[i])))[2:])[-2:]
+    def __analyze__(self) -> None:
+        # duplicates are grouped whether or not files are indexed
+        files = self.config["files"]
+        if files.get("index", True):
+            self.__do_index__()
+        else:
+            self.__fingerprint__(
+                files.get("batch", 1000), files.get("workers", os.cpu_count() or 1)
+            )
 
-        return f"#{__hex__(0)}{__hex__(1)}{__hex__(2)}"
+    def __fingerprint__(self, batch: int, workers: int) -> None:
+        from modules.metadata import fingerprint
+
+        # copies of the same picture are grouped and selected as one file
+        duplicates = self.config["files"].get("duplicates", {})
+        match = duplicates.get("match", "exact") if duplicates.get("enabled") else ""
+        if (self.catalog.get_state("duplicates") or "") != match:
+            logging.info(f"Grouping duplicates: {match or 'off'}")
+            self.catalog.regroup(match)
+            self.catalog.set_state("duplicates", match)
+        if match == "":
+            return
+        pending = self.catalog.get_unfingerprinted()
+        if len(pending) == 0:
+            return
+        logging.info(f"Fingerprinting {len(pending)} files with {workers} workers")
+        rows: list[tuple[str, str, str | None]] = []
+        for file, (digest, phash) in pool_map(fingerprint, pending, workers):
+            rows.append((file, digest, phash))
+            if len(rows) == batch:
+                self.catalog.set_fingerprints(rows, match)
+                rows = []
+        self.catalog.set_fingerprints(rows, match)
+        logging.info(
+            f"Fingerprinted {len(pending)} files, "
+            f"{self.catalog.get_eligible_count()} distinct eligible files"
+        )
 
     def __get_count__(self, verbose: bool = False) -> int:
         count: int = self.catalog.get_count()
@@ -347,20 +602,157 @@ version          Displays the current program version and exits.
             logging.info(f"{count} files in repository")
         return count
 
-    def __set_backdrop__(self, style: str, exception: bool) -> str:
-        filename = self.config["wallpaper"]["file"]
+    def __pick__(self) -> tuple[str, str | None] | None:
+        total: int = self.catalog.get_eligible_count()
+        if total == 0 and self.__get_count__() == 0:
+            logging.info("Repository is empty. Recreating…")
+            self.__do_reload__()
+            total = self.catalog.get_eligible_count()
+        if total == 0:
+            logging.warning("No eligible files in repository.")
+            return None
+        if self.config["wallpaper"].get("order", "random") != "shuffle":
+            n = secrets.randbelow(total)
+            filename, style = self.catalog.get_nth_file(n)
+            logging.info(f"{n}: {filename}")
+            return filename, style
+        # every eligible file is shown once before any is shown again
+        cursor = self.catalog.get_cursor()
+        if cursor >= total:
+            logging.info(f"All {total} eligible files shown, starting a new cycle")
+            cursor = 0
+            self.catalog.set_cursor(cursor)
+        n = cursor + secrets.randbelow(total - cursor)
+        filename, style = self.catalog.take_nth_file(n)
+        logging.info(f"{cursor + 1}/{total}: {filename}")
+        return filename, style
+
+    def __pillow__(self) -> bool:
+        # checked before self.engine, so magick users never import Pillow
+        return (
+            self.config.get("engine", "magick") == "pillow" and self.engine.available()
+        )
+
+    def __prefetching__(self) -> bool:
+        return (
+            "prefetch" in self.config
+            and self.config["prefetch"]["enabled"]
+            and self.cache.enabled()
+        )
+
+    def __spawn__(self, command: str) -> None:
+        # runs another command of this program in the background
+        args = [sys.executable, "-OO", self.program, command]
+        args += ["--config", self.args.config]
+        spawn(args + (["--debug"] if self.args.debug else []))
+
+    def __get_source__(
+        self, filename: str, box: tuple[int, int] | None, plan: Plan
+    ) -> tuple[object, int, int, Step | None]:
+        """Decodes filename once for the backdrops of every output.
+
+        Returns the image (a file oriented by magick, or the image in memory
+        with the Pillow engine), the size of the full image and the step that
+        orients it. Given a box, the image is decoded at the smallest size
+        that still covers it. Files Pillow cannot read, such as SVG or HEIC,
+        or cannot decode within the memory limit are oriented by magick even
+        with the Pillow engine.
+        """
+        if self.__pillow__():
+            from PIL import Image
+
+            try:
+                image, width, height = self.engine.open(filename, box)
+                return image, width, height, None
+            except (OSError, Image.DecompressionBombError) as e:
+                # UnidentifiedImageError is an OSError too
+                logging.info(f"Pillow cannot open {filename}, using magick: {e}")
+        from modules.metadata import ROTATED, probe, reduced
+
         oriented = self.system.create_temp_file(suffix=".png")
-        script = Script(self.system)
-        script.append(f'magick "{filename}" -auto-orient {oriented}')
-        script.append(f"identify -format '%w|%h' {oriented}")
-        _, result, _ = script.run()
-        params = result.split("|")
-        image_width = int(params[0])
-        image_height = int(params[1])
+        metadata = self.catalog.get_metadata(filename)
+        width, height, orientation = (
+            probe(filename) if metadata is None else metadata[:3]
+        )
+        size = reduced(width, height, box)
+        if size is None:
+            orient = ["magick", filename, "-auto-orient", oriented]
+        else:
+            # the hint lets the JPEG decoder scale down by up to 1/8
+            hint = size[::-1] if orientation in ROTATED else size
+            orient = [
+                *["magick", "-define", "jpeg:size={}x{}".format(*hint), filename],
+                *["-auto-orient", "-resize", "{}x{}".format(*size), oriented],
+            ]
+        return oriented, width, height, plan.add(orient, label="source")
+
+    def __overlap__(
+        self,
+        oriented: str,
+        placed: tuple[int, int],
+        width: int,
+        height: int,
+        base: str,
+    ) -> list[str]:
+        from modules.metadata import margins
+
+        # the edge strips of the placed image are stretched over the bars
+        overlap = self.config["wallpaper"]["filler"]["overlap"]
+        placed_width, placed_height = placed
+        left, right, top, bottom = margins(placed, width, height)
+        argv = ["magick", oriented, "-resize", f"{placed_width}x{placed_height}!"]
+        strip = min(overlap["width"], placed_width)
+        if left > 0:
+            argv += [
+                *["(", "-clone", "0", "-crop", f"{strip}x{placed_height}+0+0"],
+                *[
+                    "+repage",
+                    "-resize",
+                    f"{left}x{placed_height}!",
+                    ")",
+                    "-insert",
+                    "0",
+                ],
+            ]
+        if right > 0:
+            argv += [
+                *["(", "-clone", "1" if left > 0 else "0", "-crop"],
+                f"{strip}x{placed_height}+{placed_width - strip}+0",
+                *["+repage", "-resize", f"{right}x{placed_height}!", ")"],
+            ]
+        row_width = placed_width + left + right
+        strip = min(overlap["height"], placed_height)
+        argv.append("+append")
+        if top > 0:
+            argv += [
+                *["(", "-clone", "0", "-crop", f"{row_width}x{strip}+0+0"],
+                *["+repage", "-resize", f"{row_width}x{top}!", ")", "-insert", "0"],
+            ]
+        if bottom > 0:
+            argv += [
+                *["(", "-clone", "1" if top > 0 else "0", "-crop"],
+                f"{row_width}x{strip}+0+{placed_height - strip}",
+                *["+repage", "-resize", f"{row_width}x{bottom}!", ")"],
+            ]
+        # images larger than the screen are cropped around their center
+        return [
+            *argv,
+            *["-append", "-gravity", "Center", "-extent", f"{width}x{height}", base],
+        ]
+
+    def __render_backdrop__(
+        self,
+        filename: str,
+        source: tuple[object, int, int, Step | None],
+        style: str,
+        exception: bool,
+        output: dict,
+        plan: Plan,
+    ) -> tuple[str, Step]:
+        oriented, image_width, image_height, decoded = source
         image_ratio = image_width / image_height
-        script.reset()
-        width = self.config["width"]
-        height = self.config["height"]
+        width = output["width"]
+        height = output["height"]
         backdrop = self.system.create_temp_file(suffix=".png")
         if not exception:
             if self.config["wallpaper"]["auto_adjust"]["enabled"]:
@@ -376,154 +768,329 @@ version          Displays the current program version and exits.
                         style = "fit/scale"
                 elif image_ratio < 1:
                     style = "fit/scale"
-        base = self.system.create_temp_file(suffix=".png")
+        if not isinstance(oriented, str):  # in memory, for the Pillow engine
+            step = plan.call(
+                self.engine.render,
+                oriented,
+                style,
+                width,
+                height,
+                backdrop,
+                label="backdrop",
+            )
+            return backdrop, step
+        from modules.colors import KEYWORDS
+        from modules.metadata import blur_proxy
+
+        size = f"{width}x{height}"
+        screen_ratio = width / height
+        cover = str(width) if image_ratio < screen_ratio else f"x{height}"
 
-        def fill_base() -> None:
+        def fill_base(placed: tuple[int, int]) -> tuple[str, Step | None]:
+            # placed is the size of the image drawn over the base
             filler = self.config["wallpaper"]["filler"]
             mode = filler["mode"]
-            if mode == "blur":
-                screen_ratio = width / height
-                size = str(width) if image_ratio < screen_ratio else f"x{height}"
-                script.append(
-                    f"magick -size {width}x{height} canvas:none -gravity Center \\"
-                )
-                script.append(f"  {oriented} -resize {size} -composite \\")
-                script.append(f"  -channel RGBA -blur {filler[mode]} \\")
-                script.append(f"  {base}")
-            elif mode == "overlap":
-                pass
-            elif mode == "blank":
+            base = self.system.create_temp_file(suffix=".png")
+            if mode == "blank":
                 color = filler[mode]["color"]
                 color = (
-                    self.__get_base_color__(color)
-                    if color in ["mean", "median"]
+                    self.__get_base_color__(color, filename)
+                    if color in KEYWORDS
                     else color
                 )
-                script.append(f"magick -size {width}x{height} canvas:{color} {base}")
+                return base, plan.add(
+                    ["magick", "-size", size, f"canvas:{color}", base], label="filler"
+                )
+            key = None
+            if self.cache.enabled():
+                key = self.cache.key(
+                    *self.__get_identity__(filename),
+                    mode,
+                    filler.get(mode),
+                    width,
+                    height,
+                    placed if mode == "overlap" else None,
+                )
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached, None
+            if mode == "blur":
+                proxy_width, proxy_height, radius, sigma = blur_proxy(
+                    filler[mode], width, height
+                )
+                proxy = f"{proxy_width}x{proxy_height}"
+                argv = [
+                    *["magick", oriented, "-scale", f"{proxy}^", "-background"],
+                    *["none", "-gravity", "Center", "-extent", proxy, "-channel"],
+                    *["RGBA", "-blur", f"{radius:g}x{sigma:g}", "+channel"],
+                    *["-filter", "Triangle", "-resize", f"{size}!", base],
+                ]
+            else:  # overlap
+                argv = self.__overlap__(oriented, placed, width, height, base)
+            step = plan.add(argv, after=[decoded], label="filler")
+            if key is not None:
+                plan.defer(self.cache.put, key, base)
+            return base, step
 
         if style == "center":
-            fill_base()
-            script.append(
-                f"magick {base} -gravity Center {oriented} -composite {backdrop}"
+            base, filled = fill_base((image_width, image_height))
+            step = plan.add(
+                [
+                    "magick",
+                    base,
+                    "-gravity",
+                    "Center",
+                    oriented,
+                    "-composite",
+                    backdrop,
+                ],
+                after=[filled, decoded],
             )
         elif style == "combo/mosaic":
             tile = self.system.create_temp_file(suffix=".png")
-            script.append(f"magick {oriented} -resize {width}x{height} {tile}")
-            script.append(f"magick -size {width}x{height} tile:{tile} {backdrop}")
+            step = plan.add(
+                ["magick", oriented, "-resize", size, tile], after=[decoded]
+            )
+            step = plan.add(
+                ["magick", "-size", size, f"tile:{tile}", backdrop], after=[step]
+            )
         elif style == "fill/zoom":
-            screen_ratio = width / height
-            size = str(width) if image_ratio < screen_ratio else f"x{height}"
-            script.append(
-                f"magick -size {width}x{height} canvas:none -gravity Center {oriented} -resize {size} -composite {backdrop}"
+            step = plan.add(
+                [
+                    *["magick", "-size", size, "canvas:none", "-gravity", "Center"],
+                    *[oriented, "-resize", cover, "-composite", backdrop],
+                ],
+                after=[decoded],
             )
         elif style == "fit/scale":
-            fill_base()
+            # the filler and the scaled image are drawn at the same time
             scaled = self.system.create_temp_file(suffix=".png")
-            script.append(f"magick {oriented} -resize {width}x{height} {scaled}")
-            script.append(
-                f"magick {base} -gravity Center {scaled} -composite {backdrop}"
+            step = plan.add(
+                ["magick", oriented, "-resize", size, scaled], after=[decoded]
+            )
+            scale = min(width / image_width, height / image_height)
+            base, filled = fill_base(
+                (
+                    max(1, round(image_width * scale)),
+                    max(1, round(image_height * scale)),
+                )
+            )
+            step = plan.add(
+                ["magick", base, "-gravity", "Center", scaled, "-composite", backdrop],
+                after=[filled, step],
             )
         elif style == "stretch":
-            script.append(f"magick {oriented} -resize {width}x{height}! {backdrop}")
+            step = plan.add(
+                ["magick", oriented, "-resize", f"{size}!", backdrop], after=[decoded]
+            )
         else:  # tile
-            script.append(f"magick -size {width}x{height} tile:{oriented} {backdrop}")
-        script.run()
-        return backdrop
+            step = plan.add(
+                ["magick", "-size", size, f"tile:{oriented}", backdrop],
+                after=[decoded],
+            )
+        step.label = "backdrop"
+        return backdrop, step
+
+    def __set_backdrops__(
+        self,
+        filename: str,
+        style: str,
+        exception: bool,
+        outputs: list[dict],
+        plan: Plan,
+    ) -> list[tuple[str, Step | None]]:
+        """Returns the backdrop of filename for each output, with the step of
+        plan that renders it, or None if it was cached.
+
+        The source is decoded once for all outputs, and the new backdrops are
+        cached once plan has run.
+        """
+        backdrops: list[tuple[str, Step | None] | None] = [None] * len(outputs)
+        keys: list[str] = []
+        if self.cache.enabled():
+            identity = self.__get_identity__(filename)
+            for i, output in enumerate(outputs):
+                keys.append(
+                    self.cache.key(
+                        *identity,
+                        style,
+                        exception,
+                        output["width"],
+                        output["height"],
+                        self.config["wallpaper"]["filler"],
+                        self.config["wallpaper"]["auto_adjust"],
+                    )
+                )
+                cached = self.cache.get(keys[i])
+                if cached is not None:
+                    logging.info(f"Reusing rendered backdrop {cached}")
+                    backdrops[i] = cached, None
+        source = None
+        box = None
+        if style in RESIZED:
+            box = (
+                max(output["width"] for output in outputs),
+                max(output["height"] for output in outputs),
+            )
+        for i, output in enumerate(outputs):
+            if backdrops[i] is not None:
+                continue
+            if source is None:
+                # only the Pillow engine decodes here, magick in a source step
+                with span("decode"):
+                    source = self.__get_source__(filename, box, plan)
+            backdrops[i] = self.__render_backdrop__(
+                filename, source, style, exception, output, plan
+            )
+            if self.cache.enabled():
+                plan.defer(self.cache.put, keys[i], backdrops[i][0])
+        return backdrops
+
+    def __set_current__(self, filename: str, style: str | None) -> None:
+        self.config["wallpaper"]["file"] = filename
+        self.catalog.set_state("file", filename)
+        self.catalog.add_history(filename, style)
 
     def __set_wallpaper__(self, style: str, exception: bool) -> None:
-        backdrop = self.__set_backdrop__(style, exception)
-        foreground = self.system.create_temp_file(suffix=".png")
-        fore = Script(self.system)
-        command = f"magick -size {self.config['width']}x{self.config['height']} canvas:none \\"
-        fore.append(command)
-        background = self.system.create_temp_file(suffix=".png")
-        back = Script(self.system)
-        back.append(command)
-        for module in self.config["modules"]:
-            if module["enabled"]:
-                self.__apply_module__(module, style, fore, back)
-        fore.append(f"  {foreground}")
-        fore.run()
-        back.append(f"  -channel RGBA -blur 2x2 {background}")
-        back.run()
-        script = Script(self.system)
-        wallpaper = self.config["wallpaper"]["wallpaper"]
-        script.append(
-            f"magick {backdrop} {background} -composite {foreground} -composite {wallpaper}"
-        )
-        script.run()
-        execute(
-            [
-                "./scripts/wallpaper.sh",
-                wallpaper,
-                self.config["wallpaper"]["filler"]["blur"],
-            ]
+        outputs = self.__get_outputs__()
+        # backdrops, overlays, composites and setters all go into one plan,
+        # so the overlays are drawn while the backdrops are rendered
+        plan = Plan()
+        backdrops = self.__set_backdrops__(
+            self.config["wallpaper"]["file"], style, exception, outputs, plan
         )
+        from modules.desktop import detect
+        from modules.weather import Weather
+
+        texts: dict[int, str] = {}
+        env = detect().env()
+        applied = None
+        for number, (output, (backdrop, rendered)) in enumerate(
+            zip(outputs, backdrops)
+        ):
+            layers = []
+            steps = [rendered]
+            for index, module in enumerate(self.config["modules"]):
+                if not module["enabled"]:
+                    continue
+                layer, key = self.__get_layer__(index, module, style, output)
+                layers.append(layer)
+                if key is None:
+                    continue
+                if index not in texts:
+                    with span(f"text:{module['type']}"):
+                        texts[index] = self.__get_text__(module, style)
+                # the stale layer is never reused if it cannot be redrawn; its
+                # new key is only recorded once the whole plan succeeded
+                try:
+                    os.remove(layer)
+                except FileNotFoundError:
+                    pass
+                steps.append(
+                    self.__apply_module__(module, texts[index], layer, output, plan)
+                )
+                plan.defer(self.catalog.set_state, layer, f"{key} {time.time()}")
+            wallpaper = output["wallpaper"]
+            if self.__pillow__():
+                composite = plan.call(
+                    self.engine.composite,
+                    backdrop,
+                    layers,
+                    wallpaper,
+                    after=steps,
+                    label="composite",
+                )
+            else:
+                argv = ["magick", backdrop]
+                for layer in layers:
+                    argv += [layer, "-composite"]
+                composite = plan.add([*argv, wallpaper], after=steps, label="composite")
+            # outputs are set one after the other, in order
+            args = (
+                [output["name"], number, len(outputs)]
+                if len(output["name"]) > 0
+                else []
+            )
+            applied = plan.add(
+                [
+                    "./scripts/wallpaper.sh",
+                    wallpaper,
+                    self.config["wallpaper"]["filler"]["blur"],
+                    *args,
+                ],
+                after=[composite, applied],
+                label="apply",
+                env=env,
+            )
+        for module in self.config["modules"]:
+            if (
+                module["enabled"]
+                and module["type"] == "weather"
+                and Weather(module, self.system).is_stale()
+            ):
+                # the current panel is used now and replaced in the background
+                self.__spawn__("weather")
+                break
+        # the steps are timed under their own labels, and the plan as a whole
+        with span("plan"):
+            plan.run()
 
     def exit(self, code: int) -> None:
-        if code == 0:
-            file = self.args.config
-            try:
-                os.replace(file, file + ".bak")
-            except FileNotFoundError:
-                pass
-            with open(file, "w") as f:
-                json.dump(self.config, f, indent=2)
+        PROFILER.report()
         logging.info("Done!")
         sys.exit(code)
 
     def start(self, version: str) -> None:
         logging.debug(self.args)
         logging.debug(self.extra)
+        if self.args.command in ["commands", "help", "version"]:
+            # needs neither the configuration nor the catalog
+            self.exit(self.__dispatch__(self.args.command, version))
         config_file = self.args.config
         logging.info(
             f"{sys.argv[0]} {version} is reading configuration file {config_file}"
         )
         try:
-            with open(config_file, "r") as f:
-                self.config = json.load(f)
+            self.config = load(config_file)
         except FileNotFoundError:
             logging.critical(f"Configuration file {config_file} not found.")
             self.exit(2)
-        self.exceptions = Exceptions(self.config["wallpaper"]["exceptions"])
+        except ConfigError as e:
+            logging.critical(f"Configuration file {config_file} is invalid: {e}")
+            self.exit(2)
+        if self.args.profile:
+            # totals are kept next to the catalog, spans in profile.LOG
+            PROFILER.enable(
+                os.path.splitext(self.config["catalog"])[0] + "_profile.json"
+            )
+        for resource, limit in self.config.get("limits", {}).items():
+            # every magick and identify run by this process and its children
+            os.environ[f"MAGICK_{resource.upper()}_LIMIT"] = str(limit)
+        if self.args.command in FORWARDED and "daemon" in self.config:
+            from modules.daemon import REPLY_TIMEOUT, forward
+
+            daemon = self.config["daemon"]
+            code = forward(
+                daemon["socket"],
+                [self.args.command, *self.extra],
+                daemon.get("timeout", REPLY_TIMEOUT),
+            )
+            if code is not None:
+                logging.debug(f"Daemon replied {code}")
+                self.exit(code)
         with System(self.config) as self.system:
             with Models(self.config["catalog"]) as self.catalog:
+                self.cache = RenderCache(self.config, self.catalog)
                 exit_code: int = 0
                 try:
-                    command = self.args.command
-                    if command == "commands" or command == "help":
-                        self.__help__(version)
-                    elif command == "convert":
-                        self.__do_convert__()
-                    elif command == "count":
-                        self.__get_count__(True)
-                    elif command == "delete":
-                        self.__do_delete__()
-                    elif command == "next":
-                        self.__do_next__()
-                    elif command == "reload":
-                        self.__do_reload__()
-                    elif command == "skip":
-                        self.__do_skip__()
-                    elif command == "version":
-                        self.__do_version__(version)
-                    elif command in [
-                        "center",
-                        "default",
-                        "combo",
-                        "fill",
-                        "fit",
-                        "mosaic",
-                        "scale",
-                        "stretch",
-                        "tile",
-                        "zoom",
-                    ]:
-                        self.__do_style__(command)
-                    else:
-                        print(f"Unknown command: {command}")
-                        exit_code = 3
+                    if self.catalog.get_state("imported") is None:
+                        self.__import_config__()
+                    current = self.catalog.get_state("file")
+                    if current is not None:
+                        self.config["wallpaper"]["file"] = current
                 except Exception as e:
                     logging.exception(e, exc_info=True, stack_info=True)
                     exit_code = 1
+                else:
+                    exit_code = self.__dispatch__(self.args.command, version)
         self.exit(exit_code)
@@ -0,0 +1,128 @@
+# modules/colors.py
+
+import importlib.util
+import json
+import logging
+import subprocess
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Final
+
+from modules.models.models import Models
+from modules.profile import span
+from modules.system import execute
+
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+
+# NumPy is optional, identify remains the fallback; like Pillow, it is only
+# imported once statistics are actually computed, which keeps startup short
+NUMPY: Final[bool] = importlib.util.find_spec("numpy") is not None
+PILLOW: Final[bool] = importlib.util.find_spec("PIL") is not None
+KEYWORDS: Final[list[str]] = ["mean", "median", "dominant"]
+# statistics are taken on a copy that fits in SAMPLE×SAMPLE pixels
+SAMPLE: Final[int] = 256
+DOMINANT: Final[int] = 5
+
+
+def sample(file: str) -> "np.ndarray":
+    """Returns the RGB pixels of a small copy of file as an N×3 array."""
+    import numpy as np
+
+    if PILLOW:
+        from PIL import Image
+
+        try:
+            with Image.open(file) as image:
+                image.draft("RGB", (SAMPLE, SAMPLE))
+                image = image.convert("RGB")
+                image.thumbnail((SAMPLE, SAMPLE))
+                return np.asarray(image).reshape(-1, 3)
+        except (OSError, Image.DecompressionBombError) as e:
+            # e.g. SVG or HEIC, which magick reads
+            logging.debug(f"Pillow cannot sample {file}: {e}")
+    command = [
+        *["magick", "-define", f"jpeg:size={SAMPLE * 2}x{SAMPLE * 2}", file + "[0]"],
+        *["-thumbnail", f"{SAMPLE}x{SAMPLE}", "-alpha", "off", "-depth", "8", "rgb:-"],
+    ]
+    with span("exec:magick"):
+        result = subprocess.run(command, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.uint8).reshape(-1, 3)
+
+
+def summarize(pixels: "np.ndarray") -> dict:
+    """Returns the mean and median of each channel, and the dominant colors
+    from the most frequent first, as #rrggbb strings.
+    """
+    import numpy as np
+
+    def rgb(values) -> str:
+        return "#" + "".join(f"{round(float(value)):02x}" for value in values)
+
+    # dominant colors are the averages of the most populated 16×16×16 bins
+    codes = (pixels[:, 0] >> 4).astype(np.int32) << 8
+    codes |= (pixels[:, 1] >> 4).astype(np.int32) << 4
+    codes |= pixels[:, 2] >> 4
+    counts = np.bincount(codes, minlength=4096)
+    sums = np.stack(
+        [np.bincount(codes, pixels[:, c], minlength=4096) for c in range(3)], axis=1
+    )
+    top = np.argsort(counts, kind="stable")[::-1][:DOMINANT]
+    top = top[counts[top] > 0]
+    return {
+        "mean": rgb(pixels.mean(axis=0)),
+        "median": rgb(np.median(pixels, axis=0)),
+        "dominant": [rgb(sums[i] / counts[i]) for i in top],
+    }
+
+
+def describe(image: "Image.Image") -> dict:
+    """Returns summarize() for an image already in memory."""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    small = ImageOps.contain(image, (SAMPLE, SAMPLE), Image.BOX).convert("RGB")
+    return summarize(np.asarray(small).reshape(-1, 3))
+
+
+def measure(file: str) -> dict:
+    """Returns summarize() for file. Without NumPy, the mean and median come
+    from identify -verbose, and the mean stands in for the dominant color.
+    """
+    if NUMPY:
+        return summarize(sample(file))
+    _, result, _ = execute(["identify", "-verbose", file])
+    stats: dict = {}
+    for keyword in ["mean", "median"]:
+        # the red, green and blue channel statistics come first
+        components = [
+            line.split()[1] for line in result.splitlines() if keyword in line
+        ]
+        stats[keyword] = "#" + "".join(
+            f"{round(float(value)):02x}" for value in components[:3]
+        )
+    stats["dominant"] = [stats["mean"]]
+    return stats
+
+
+@dataclass
+class Colors:
+    """Color statistics of image files, computed once and kept in the catalog."""
+
+    catalog: Models
+    # files outside the catalog are remembered for this run only
+    known: dict[str, dict] = field(default_factory=dict)
+
+    def get(self, file: str, keyword: str) -> str:
+        stats = self.known.get(file)
+        if stats is None:
+            palette = self.catalog.get_palette(file)
+            if palette is None:
+                with span("colors"):
+                    stats = measure(file)
+                logging.debug(f"Colors of {file}: {stats}")
+                self.catalog.set_palette(file, json.dumps(stats))
+            else:
+                stats = json.loads(palette)
+            self.known[file] = stats
+        return stats["dominant"][0] if keyword == "dominant" else stats[keyword]
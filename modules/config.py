@@ -0,0 +1,77 @@
+# modules/config.py
+
+import hashlib
+import json
+import logging
+import marshal
+import os
+from typing import Final
+
+# keys every command relies on, checked once when the file changes
+REQUIRED: Final[dict[str, list[str]]] = {
+    "": ["width", "height", "catalog", "files", "wallpaper", "modules"],
+    "files": ["type", "folders"],
+    "wallpaper": ["file", "wallpaper", "render", "filler"],
+}
+CACHE: Final[str] = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "changer"
+)
+
+
+class ConfigError(Exception):
+    pass
+
+
+def validate(config: dict) -> None:
+    """Raises ConfigError unless config has the keys every command uses."""
+    if not isinstance(config, dict):
+        raise ConfigError("not a JSON object")
+    for section, keys in REQUIRED.items():
+        values = config if section == "" else config.get(section)
+        if not isinstance(values, dict):
+            raise ConfigError(f"missing section {section}")
+        for key in keys:
+            if key not in values:
+                name = f"{section}.{key}" if section else key
+                raise ConfigError(f"missing key {name}")
+    if not isinstance(config["modules"], list):
+        raise ConfigError("modules is not a list")
+
+
+def load(file: str) -> dict:
+    """Returns the validated configuration in file.
+
+    The validated form is kept in CACHE as marshal data, which loads several
+    times faster than JSON, and is used as long as file keeps its size and
+    modification time.
+    """
+    path = os.path.abspath(file)
+    info = os.stat(path)
+    stamp = (info.st_mtime_ns, info.st_size)
+    cached = os.path.join(
+        CACHE, hashlib.sha256(path.encode()).hexdigest()[:16] + ".config"
+    )
+    try:
+        with open(cached, "rb") as f:
+            saved, config = marshal.load(f)
+        if tuple(saved) == stamp:
+            return config
+    except (OSError, EOFError, ValueError, TypeError):
+        pass  # missing, stale or unreadable: parsed again below
+    with open(path, "r") as f:
+        try:
+            config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ConfigError(str(e)) from None
+    validate(config)
+    try:
+        os.makedirs(CACHE, mode=0o700, exist_ok=True)
+        temp = f"{cached}.{os.getpid()}"
+        with open(
+            os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb"
+        ) as f:
+            marshal.dump((stamp, config), f)
+        os.replace(temp, cached)
+    except (OSError, ValueError) as e:  # the cache is an optimization only
+        logging.debug(f"Cannot cache configuration: {e}")
+    return config
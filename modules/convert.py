@@ -0,0 +1,92 @@
+# modules/convert.py
+
+import glob
+import os
+import subprocess
+from typing import Final
+
+from modules.colors import SAMPLE
+from modules.metadata import blur_proxy, probe
+from modules.system import execute
+
+VARIANTS: Final[list[str]] = ["blurred", "mean", "median"]
+
+
+def output(file: str, variant: str) -> str:
+    return f"{file}.{variant}.jpeg"
+
+
+def expand(patterns: list[str]) -> list[str]:
+    """Returns the files matched by patterns, in order and without the
+    variants written by an earlier conversion.
+    """
+    variants = tuple(output("", variant) for variant in VARIANTS)
+    files: dict[str, None] = {}
+    for pattern in patterns:
+        # a pattern matching nothing is kept, so the missing file is reported
+        for file in sorted(glob.glob(os.path.expanduser(pattern))) or [pattern]:
+            if not file.endswith(variants) and not os.path.isdir(file):
+                files[file] = None
+    return list(files)
+
+
+def stale(file: str) -> list[str]:
+    """Returns the variants of file that are missing or older than file."""
+    mtime = os.stat(file).st_mtime_ns
+    variants: list[str] = []
+    for variant in VARIANTS:
+        try:
+            if os.stat(output(file, variant)).st_mtime_ns >= mtime:
+                continue
+        except FileNotFoundError:
+            pass
+        variants.append(variant)
+    return variants
+
+
+def convert(job: tuple[str, list[str], str]) -> str | None:
+    """Writes the given variants of a file, decoding it once.
+
+    Each variant is the upright image centered on a 16:9 canvas as tall as
+    the image, over a blurred copy of itself or its mean or median color.
+    The colors are taken by the same magick, from the decoded image.
+    Returns None, or why the file could not be converted.
+    """
+    try:
+        return render(*job)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        # reported for this file only, the batch goes on
+        return str(e) or type(e).__name__
+
+
+def render(file: str, variants: list[str], blur: str) -> str | None:
+    """Does the work of convert(), raising what it cannot handle."""
+    _, height, _ = probe(file)
+    if height == 0:
+        return "not a readable image"
+    width = round(height * 16 / 9)
+    size = f"{width}x{height}"
+    argv = ["magick", file, "-auto-orient", "-write", "mpr:source", "+delete"]
+    for variant in variants:
+        if variant == "blurred":
+            proxy_width, proxy_height, radius, sigma = blur_proxy(blur, width, height)
+            proxy = f"{proxy_width}x{proxy_height}"
+            argv += [
+                *["(", "mpr:source", "-scale", f"{proxy}^", "-background", "none"],
+                *["-gravity", "Center", "-extent", proxy, "-channel", "RGBA"],
+                *["-blur", f"{radius:g}x{sigma:g}", "+channel", "-filter"],
+                *["Triangle", "-resize", f"{size}!", ")"],
+            ]
+        elif variant == "mean":
+            # a box average down to one pixel is the mean of every pixel
+            argv += ["(", "mpr:source", "-scale", "1x1!", "-scale", f"{size}!", ")"]
+        else:  # median, of a sample as colors.measure() takes it
+            argv += [
+                *["(", "mpr:source", "-thumbnail", f"{SAMPLE}x{SAMPLE}"],
+                *["-fx", "median", "-scale", "1x1!", "-scale", f"{size}!", ")"],
+            ]
+        argv += ["-gravity", "Center", "mpr:source", "-composite"]
+        argv += ["-write", output(file, variant), "+delete"]
+    # the last variant is the output of the command itself
+    code, _, err = execute([*argv[:-3], argv[-2]])
+    return None if code == 0 else err.strip() or f"magick returned {code}"
@@ -0,0 +1,137 @@
+# modules/daemon.py
+
+import logging
+import os
+import select
+import signal
+import socket
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Final
+
+if TYPE_CHECKING:  # clients forwarding a command never load the watcher
+    from modules.watcher import Watcher
+
+# seconds a client waits to reach the daemon, and then for its reply
+CONNECT_TIMEOUT: Final[float] = 5
+REPLY_TIMEOUT: Final[float] = 120
+
+
+@dataclass
+class Daemon:
+    config: dict
+    handler: Callable[[str, list[str]], int]
+    watcher: "Watcher | None" = None
+
+    def __accept__(self, server: socket.socket) -> None:
+        connection, _ = server.accept()
+        with connection:
+            connection.settimeout(5)
+            try:
+                request = connection.makefile("r").readline().split()
+            except (OSError, UnicodeDecodeError) as e:
+                logging.warning(f"Bad request: {e}")
+                return
+            if len(request) == 0:
+                return
+            logging.info(f"Request: {request}")
+            if request[0] == "stop":
+                code = 0
+                self.running = False
+            elif request[0] == "daemon":
+                code = 3
+            else:
+                code = self.handler(request[0], request[1:])
+                if request[0] == "next":
+                    self.due = time.monotonic() + self.config["interval"]
+            try:
+                connection.sendall(f"{code}\n".encode())
+            except OSError:
+                pass
+
+    def __listen__(self) -> socket.socket:
+        path = self.config["socket"]
+        if forward(path, []) is not None:
+            raise RuntimeError(f"Another daemon is listening on {path}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen()
+        return server
+
+    def __stop__(self, signum, frame) -> None:
+        logging.info(f"Received signal {signum}")
+        self.running = False
+
+    def run(self) -> None:
+        interval = self.config["interval"]
+        server = self.__listen__()
+        signal.signal(signal.SIGTERM, self.__stop__)
+        signal.signal(signal.SIGINT, self.__stop__)
+        logging.info(f"Listening on {self.config['socket']} (interval={interval}s)")
+        self.running = True
+        self.due = time.monotonic() + interval
+        try:
+            sources = [server] if self.watcher is None else [server, self.watcher]
+            while self.running:
+                # wake up at least once a second so signals are noticed
+                wait = max(0, min(self.due - time.monotonic(), 1)) if interval else 1
+                if self.watcher is not None:
+                    wait = min(wait, self.watcher.timeout())
+                try:
+                    readable, _, _ = select.select(sources, [], [], wait)
+                except InterruptedError:
+                    readable = []
+                if server in readable:
+                    self.__accept__(server)
+                if self.watcher is not None:
+                    try:
+                        if self.watcher in readable:
+                            self.watcher.read()
+                        self.watcher.flush()
+                    except Exception as e:
+                        logging.exception(e, exc_info=True, stack_info=True)
+                if interval and time.monotonic() >= self.due:
+                    self.handler("next", [])
+                    self.due = time.monotonic() + interval
+        finally:
+            server.close()
+            try:
+                os.remove(self.config["socket"])
+            except FileNotFoundError:
+                pass
+
+
+def forward(
+    path: str, request: list[str], timeout: float = REPLY_TIMEOUT
+) -> int | None:
+    """Sends request to a running daemon and returns its exit code.
+
+    Returns None if the request could not be sent, e.g. because no daemon is
+    listening on path, so the caller can run it instead. Once it is sent,
+    the daemon may have acted on it, so any later failure returns 1. An
+    empty request only checks whether a daemon is listening.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.settimeout(CONNECT_TIMEOUT)
+            client.connect(path)
+            if len(request) == 0:
+                return 0
+            client.sendall((" ".join(request) + "\n").encode())
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        except OSError as e:  # e.g. a socket of another user
+            logging.warning(f"Cannot reach the daemon on {path}: {e}")
+            return None
+        try:
+            client.settimeout(timeout)
+            reply = client.makefile("r").readline()
+        except OSError as e:  # also a timeout, or a daemon dying mid-request
+            logging.error(f"No reply from the daemon to {request[0]}: {e}")
+            return 1
+    return int(reply) if reply.strip().isdigit() else 1
@@ -0,0 +1,164 @@
+# modules/desktop.py
+
+import json
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Final
+
+from modules.system import execute
+
+# (desktop, process that identifies it, process holding the session, version
+# command); when several are running the last one wins, as in desktop.sh
+DESKTOPS: Final[list[tuple[str, str, str, str]]] = [
+    ("bspwm", "bspwm", "bspwm", "bspwm -v | awk '{print \"bspwm \" $1}'"),
+    (
+        "Budgie",
+        "budgie-wm",
+        "budgie-desktop",
+        "budgie-desktop --version | grep budgie",
+    ),
+    ("Cinnamon", "cinnamon", "cinnamon", "cinnamon --version"),
+    ("dwm", "dwm", "dwm", "/usr/local/bin/dwm -v 2>&1 | tr -d '\\n'"),
+    ("Gnome", "gnome-shell", "gnome-shell", "gnome-shell --version"),
+    (
+        "herbstluftwm",
+        "herbstluftwm",
+        "herbstluftwm",
+        "herbstluftwm --version | grep herbstluftwm",
+    ),
+    (
+        "Hyprland",
+        "Hyprland",
+        "Hyprland",
+        'echo "Hyprland $(hyprctl -j version | jq --raw-output \'. | "\\(.tag) commit \\(.commit) (\\(.commit_date))"\')"',
+    ),
+    ("i3", "i3", "i3", "i3 --version | sed -e 's/) .*/)/'"),
+    (
+        "KDE",
+        "plasmashell",
+        "kded6",
+        'printf "%s\\n%s" "$(kded6 --version 2> /dev/null)" "$(plasmashell --version 2> /dev/null)"',
+    ),
+    ("MangoWC", "mango", "mango", "mango -v 2>&1"),
+    ("MATE", "mate-session", "mate-session", "mate-session --version"),
+    ("niri", "niri-session", "niri-session", "niri --version"),
+    (
+        "Qtile",
+        "qtile",
+        "qtile",
+        "/home/zezo/.local/bin/qtile --version | awk '{print \"Qtile \" $1}'",
+    ),
+    ("scroll", "scroll", "scroll", "scroll --version"),
+    ("sway", "sway", "sway", "sway --version"),
+    (
+        "Xfce",
+        "xfce4-session",
+        "xfce4-session",
+        "xfce4-session --version | grep xfce4-session | awk '{print \"Xfce \" $2}'",
+    ),
+]
+# variables the wallpaper setters need, taken from the session when missing
+ENVIRONMENT: Final[list[str]] = [
+    "DBUS_SESSION_BUS_ADDRESS",
+    "DISPLAY",
+    "HYPRLAND_INSTANCE_SIGNATURE",
+    "KDE_SESSION_VERSION",
+    "SWAYSOCK",
+    "WAYLAND_DISPLAY",
+    "XDG_RUNTIME_DIR",
+]
+CACHE: Final[str] = "/tmp/changer_desktop.json"
+# sessions started as scripts, e.g. qtile or niri-session, run under these
+INTERPRETERS: Final[list[str]] = ["bash", "dash", "python", "python3", "sh", "zsh"]
+
+
+def process_names(pid: int | str) -> list[str]:
+    """Returns the name of a process and, for an interpreter, of the script
+    it runs."""
+    names: list[str] = []
+    try:
+        with open(f"/proc/{pid}/comm", "r") as f:
+            names.append(f.read().strip())
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            argv = f.read().split(b"\0")
+    except OSError:
+        return names
+    args = [os.path.basename(arg.decode(errors="replace")) for arg in argv]
+    names.append(args[0])
+    if re.sub(r"[\d.]+$", "", args[0]) in INTERPRETERS:
+        # the script is the first argument that is not an option
+        names += [arg for arg in args[1:] if not arg.startswith("-")][:1]
+    return names
+
+
+@dataclass
+class Desktop:
+    name: str = "UNKNOWN"
+    version: str = ""
+    pid: int | None = None
+    process: str = ""
+    environment: dict[str, str] = field(default_factory=dict)
+
+    def env(self) -> dict[str, str]:
+        """Returns the environment for scripts that act on this desktop."""
+        env = dict(os.environ)
+        for key, value in self.environment.items():
+            env.setdefault(key, value)
+        env["CHANGER_DESKTOP"] = self.name
+        env["CHANGER_PID"] = "" if self.pid is None else str(self.pid)
+        return env
+
+
+def scan_processes() -> Desktop:
+    running: dict[str, int] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            for name in process_names(entry):
+                running.setdefault(name, int(entry))
+    desktop = Desktop()
+    for name, process, session, command in DESKTOPS:
+        if process in running:
+            desktop = Desktop(name, command, running.get(session, running[process]))
+            desktop.process = session if session in running else process
+    if desktop.pid is not None:
+        _, out, _ = execute(["sh", "-c", desktop.version])
+        desktop.version = out.strip("\n")
+        if desktop.name == "MangoWC":
+            desktop.environment["WAYLAND_DISPLAY"] = "wayland-0"
+        try:
+            with open(f"/proc/{desktop.pid}/environ", "rb") as f:
+                for item in f.read().split(b"\0"):
+                    key, _, value = item.decode(errors="replace").partition("=")
+                    if key in ENVIRONMENT:
+                        desktop.environment.setdefault(key, value)
+        except OSError:
+            pass
+    if "dms" in running:  # DankMaterialShell (addon)
+        _, out, _ = execute(["dms", "version"])
+        desktop.version = f"{desktop.version}\n{out.strip()}"
+    return desktop
+
+
+def detect() -> Desktop:
+    """Finds the running desktop, walking /proc only once per session.
+
+    The result is kept in CACHE for as long as the process that holds the
+    session is alive.
+    """
+    try:
+        with open(CACHE, "r") as f:
+            desktop = Desktop(**json.load(f))
+        if desktop.pid is not None and desktop.process in process_names(desktop.pid):
+            return desktop
+    except (FileNotFoundError, json.JSONDecodeError, TypeError):
+        pass
+    desktop = scan_processes()
+    logging.info(f"Desktop: {desktop.name} ({desktop.pid})")
+    with open(
+        os.open(CACHE + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w"
+    ) as f:
+        json.dump(asdict(desktop), f)
+    os.replace(CACHE + ".tmp", CACHE)
+    return desktop
@@ -0,0 +1,210 @@
+# modules/engine.py
+
+import logging
+from dataclasses import dataclass, field
+from typing import Final
+
+from modules.colors import KEYWORDS, NUMPY, describe
+from modules.metadata import blur_proxy, margins, parse_size, reduced
+
+try:
+    from PIL import Image, ImageColor, ImageFilter, ImageOps, ImageStat
+except ImportError:  # Pillow is optional; magick remains the fallback
+    Image = None
+
+ORIENTATION: Final[int] = 0x0112
+# EXIF orientations that swap width and height once transposed
+EXIF_ROTATED: Final[list[int]] = [5, 6, 7, 8]
+
+
+@dataclass
+class Engine:
+    """Renders backdrops in-process with Pillow, mirroring the magick pipeline."""
+
+    config: dict
+    images: dict = field(default_factory=dict)
+
+    def available(self) -> bool:
+        return self.config.get("engine", "magick") == "pillow" and Image is not None
+
+    def __check__(self, image: "Image.Image") -> None:
+        # the decoded pixels and their RGBA copy must fit in the limit; with
+        # a draft, the pixels are those of the scaled JPEG
+        limit = self.config.get("limits", {}).get("memory")
+        if limit is None:
+            return
+        needed = image.width * image.height * (len(image.getbands()) + 4)
+        if needed > parse_size(limit):
+            raise Image.DecompressionBombError(
+                f"{image.width}x{image.height} image needs more memory than {limit}"
+            )
+
+    def color(self, image: "Image.Image", keyword: str) -> str:
+        if NUMPY:
+            stats = describe(image)
+            return stats["dominant"][0] if keyword == "dominant" else stats[keyword]
+        stat = ImageStat.Stat(image.convert("RGB"))
+        # without NumPy, the dominant color is approximated by the mean
+        values = stat.median if keyword == "median" else stat.mean
+        return "#" + "".join(f"{round(value):02x}" for value in values[:3])
+
+    def composite(self, backdrop: str, layers: list[str], output: str) -> None:
+        image = self.load(backdrop).copy()
+        for layer in layers:
+            with Image.open(layer) as overlay:
+                image.alpha_composite(overlay.convert("RGBA"))
+        if output.lower().endswith((".jpg", ".jpeg")):
+            image = image.convert("RGB")
+        image.save(output, quality=92)
+
+    def load(self, file: str) -> "Image.Image":
+        # backdrops rendered by this engine stay in memory until composited
+        if file not in self.images:
+            with Image.open(file) as image:
+                self.images[file] = image.convert("RGBA")
+        return self.images[file]
+
+    def open(
+        self, file: str, box: tuple[int, int] | None = None
+    ) -> tuple["Image.Image", int, int]:
+        """Returns file upright, with the size of the full upright image.
+
+        Given a box, the image is decoded at the smallest size that still
+        covers it: JPEG files are scaled while decoding (by 1/2, 1/4 or 1/8)
+        and other formats are reduced by whole factors right after, which
+        still decodes them in full. Unlike magick, Pillow cannot spill to
+        disk: an image whose decoding needs more than the memory given in
+        limits raises DecompressionBombError, for magick to render instead.
+        """
+        with Image.open(file) as image:
+            width, height = image.size
+            rotated = image.getexif().get(ORIENTATION, 1) in EXIF_ROTATED
+            if rotated:
+                width, height = height, width
+            size = reduced(width, height, box)
+            if size is not None:
+                image.draft(image.mode, size[::-1] if rotated else size)
+            self.__check__(image)
+            image = ImageOps.exif_transpose(image)
+            if size is not None:
+                factor = min(image.width // size[0], image.height // size[1])
+                if factor > 1:
+                    image = image.reduce(factor)
+            return image.convert("RGBA"), width, height
+
+    def render(
+        self, image: "Image.Image", style: str, width: int, height: int, file: str
+    ) -> "Image.Image":
+        canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        if style == "center":
+            canvas = self.__fill__(image, image, width, height)
+            self.__center__(canvas, image)
+        elif style == "combo/mosaic":
+            self.__tile__(canvas, self.__fit__(image, width, height))
+        elif style == "fill/zoom":
+            self.__center__(canvas, self.__cover__(image, width, height))
+        elif style == "fit/scale":
+            fitted = self.__fit__(image, width, height)
+            canvas = self.__fill__(image, fitted, width, height)
+            self.__center__(canvas, fitted)
+        elif style == "stretch":
+            canvas = image.resize((width, height), Image.LANCZOS)
+        else:  # tile
+            self.__tile__(canvas, image)
+        self.images[file] = canvas
+        canvas.save(file, compress_level=1)
+        return canvas
+
+    def __center__(self, canvas: "Image.Image", image: "Image.Image") -> None:
+        x = (canvas.width - image.width) // 2
+        y = (canvas.height - image.height) // 2
+        canvas.alpha_composite(image, (max(x, 0), max(y, 0)), (max(-x, 0), max(-y, 0)))
+
+    def __cover__(self, image: "Image.Image", width: int, height: int) -> "Image.Image":
+        # same as magick -resize {width} or -resize x{height}
+        if image.width / image.height < width / height:
+            size = (width, max(1, round(image.height * width / image.width)))
+        else:
+            size = (max(1, round(image.width * height / image.height)), height)
+        return image.resize(size, Image.LANCZOS)
+
+    def __fill__(
+        self, image: "Image.Image", placed: "Image.Image", width: int, height: int
+    ) -> "Image.Image":
+        filler = self.config["wallpaper"]["filler"]
+        mode = filler["mode"]
+        canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        if mode == "blur":
+            proxy_width, proxy_height, _, sigma = blur_proxy(
+                filler[mode], width, height
+            )
+            # only the middle of the image that covers the screen is scaled
+            if image.width / image.height < width / height:
+                crop = (image.width, image.width * height / width)
+            else:
+                crop = (image.height * width / height, image.height)
+            x = (image.width - crop[0]) / 2
+            y = (image.height - crop[1]) / 2
+            proxy = image.resize(
+                (proxy_width, proxy_height),
+                Image.BOX,
+                box=(x, y, x + crop[0], y + crop[1]),
+            )
+            proxy = proxy.filter(ImageFilter.GaussianBlur(sigma))
+            canvas = proxy.resize((width, height), Image.BILINEAR)
+        elif mode == "overlap":
+            canvas = self.__overlap__(placed, width, height)
+        elif mode == "blank":
+            color = filler[mode]["color"]
+            if color in KEYWORDS:
+                color = self.color(image, color)
+            try:
+                canvas = Image.new("RGBA", (width, height), ImageColor.getrgb(color))
+            except ValueError:
+                logging.warning(f"Unknown color {color}")
+        return canvas
+
+    def __fit__(self, image: "Image.Image", width: int, height: int) -> "Image.Image":
+        # same as magick -resize {width}x{height}
+        scale = min(width / image.width, height / image.height)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.LANCZOS)
+
+    def __overlap__(
+        self, image: "Image.Image", width: int, height: int
+    ) -> "Image.Image":
+        # the edge strips of the placed image are stretched over the bars
+        overlap = self.config["wallpaper"]["filler"]["overlap"]
+        left, right, top, bottom = margins(image.size, width, height)
+        strip = min(overlap["width"], image.width)
+        row = Image.new("RGBA", (image.width + left + right, image.height))
+        row.paste(image, (left, 0))
+        if left > 0:
+            edge = image.crop((0, 0, strip, image.height))
+            row.paste(edge.resize((left, image.height), Image.BILINEAR), (0, 0))
+        if right > 0:
+            edge = image.crop((image.width - strip, 0, image.width, image.height))
+            row.paste(
+                edge.resize((right, image.height), Image.BILINEAR),
+                (left + image.width, 0),
+            )
+        strip = min(overlap["height"], row.height)
+        canvas = Image.new("RGBA", (row.width, row.height + top + bottom))
+        canvas.paste(row, (0, top))
+        if top > 0:
+            edge = row.crop((0, 0, row.width, strip))
+            canvas.paste(edge.resize((row.width, top), Image.BILINEAR), (0, 0))
+        if bottom > 0:
+            edge = row.crop((0, row.height - strip, row.width, row.height))
+            canvas.paste(
+                edge.resize((row.width, bottom), Image.BILINEAR), (0, top + row.height)
+            )
+        # images larger than the screen are cropped around their center
+        x = (canvas.width - width) // 2
+        y = (canvas.height - height) // 2
+        return canvas.crop((x, y, x + width, y + height))
+
+    def __tile__(self, canvas: "Image.Image", image: "Image.Image") -> None:
+        for y in range(0, canvas.height, image.height):
+            for x in range(0, canvas.width, image.width):
+                canvas.alpha_composite(image, (x, y))
@@ -0,0 +1,162 @@
+# modules/metadata.py
+
+import hashlib
+import subprocess
+from math import ceil
+from typing import Final
+
+from modules.system import execute
+
+FORMAT: Final[str] = "%w|%h|%[orientation]|%k|%[exif:DateTime]"
+# EXIF orientations that swap width and height once auto-oriented
+ROTATED: Final[list[str]] = ["LeftTop", "RightTop", "RightBottom", "LeftBottom"]
+# blur fillers are drawn on a proxy small enough to blur with this sigma
+PROXY_SIGMA: Final[float] = 2.0
+
+
+def extract(file: str) -> tuple[int, int, str, int | None, str | None]:
+    """Returns (width, height, orientation, colors, EXIF date) for file.
+
+    Width and height are those of the auto-oriented image. Files that
+    cannot be read are reported as 0×0 so they are not retried.
+    """
+    code, out, _ = execute(["identify", "-format", FORMAT, file + "[0]"])
+    params = out.split("|")
+    if code != 0 or len(params) != 5 or not (params[0] + params[1]).isdigit():
+        return 0, 0, "Undefined", None, None
+    width, height = int(params[0]), int(params[1])
+    if params[2] in ROTATED:
+        width, height = height, width
+    colors = int(params[3]) if params[3].isdigit() else None
+    return width, height, params[2], colors, params[4] if len(params[4]) > 0 else None
+
+
+def probe(file: str) -> tuple[int, int, str]:
+    """Returns (width, height, orientation) for file from its header alone."""
+    code, out, _ = execute(
+        ["identify", "-ping", "-format", "%w|%h|%[orientation]", file + "[0]"]
+    )
+    params = out.split("|")
+    if code != 0 or len(params) != 3 or not (params[0] + params[1]).isdigit():
+        return 0, 0, "Undefined"
+    width, height = int(params[0]), int(params[1])
+    if params[2] in ROTATED:
+        width, height = height, width
+    return width, height, params[2]
+
+
+def reduced(
+    width: int, height: int, box: tuple[int, int] | None
+) -> tuple[int, int] | None:
+    """Returns the smallest size of a width×height image that still covers
+    box, or None if the image does not need to shrink to cover it.
+    """
+    if box is None or width <= 0 or height <= 0:
+        return None
+    scale = max(box[0] / width, box[1] / height)
+    if scale >= 1:
+        return None
+    return ceil(width * scale), ceil(height * scale)
+
+
+def fingerprint(file: str) -> tuple[str, str | None]:
+    """Returns (digest, perceptual hash) for file.
+
+    The digest is a BLAKE2b hash of the content ("" if the file cannot be
+    read). The perceptual hash holds the 128 horizontal and vertical
+    difference bits of a 9×9 copy of the upright image, which resized or
+    re-encoded copies share. It is None if the image cannot be decoded or
+    has no features (a plain gradient), as those would match each other.
+    """
+    try:
+        with open(file, "rb") as f:
+            digest = hashlib.file_digest(
+                f, lambda: hashlib.blake2b(digest_size=16)
+            ).hexdigest()
+    except OSError:
+        return "", None
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # magick draws the hash thumbnail instead
+        Image = None
+    try:
+        if Image is not None:
+            with Image.open(file) as image:
+                image.draft("L", (64, 64))
+                image = ImageOps.exif_transpose(image).convert("L")
+                pixels = image.resize((9, 9), Image.BOX).tobytes()
+        else:
+            pixels = subprocess.run(
+                [
+                    *["magick", "-define", "jpeg:size=64x64", file + "[0]"],
+                    *["-auto-orient", "-colorspace", "Gray", "-resize", "9x9!"],
+                    *["-depth", "8", "gray:-"],
+                ],
+                capture_output=True,
+                check=True,
+            ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return digest, None
+    if len(pixels) != 81:
+        return digest, None
+    # one bit per pair of neighbours: is the first one brighter?
+    horizontal = vertical = 0
+    for row in range(8):
+        for column in range(8):
+            pixel = pixels[row * 9 + column]
+            horizontal = horizontal << 1 | (pixel > pixels[row * 9 + column + 1])
+            vertical = vertical << 1 | (pixel > pixels[row * 9 + column + 9])
+    if horizontal in (0, 2**64 - 1) and vertical in (0, 2**64 - 1):
+        return digest, None
+    return digest, f"{horizontal:016x}{vertical:016x}"
+
+
+def blur_proxy(blur: str, width: int, height: int) -> tuple[int, int, float, float]:
+    """Returns the size of the proxy a width×height blur filler is drawn on,
+    and the radius and sigma to blur it with before it is scaled up.
+    """
+    parts = [float(part) for part in str(blur).split("x")]
+    sigma = parts[-1]
+    radius = parts[0] if len(parts) > 1 else 0.0
+    scale = min(1.0, max(PROXY_SIGMA / sigma, 1 / 16)) if sigma > 0 else 1.0
+    return (
+        max(1, round(width * scale)),
+        max(1, round(height * scale)),
+        radius * scale,
+        sigma * scale,
+    )
+
+
+def margins(
+    placed: tuple[int, int], width: int, height: int
+) -> tuple[int, int, int, int]:
+    """Returns the left, right, top and bottom bars a placed image centered on
+    a width×height screen leaves uncovered.
+    """
+    left = max(0, (width - placed[0]) // 2)
+    top = max(0, (height - placed[1]) // 2)
+    return (
+        left,
+        max(0, width - placed[0] - left),
+        top,
+        max(0, height - placed[1] - top),
+    )
+
+
+def human(size: int) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "GiB"
+    return f"{size:.4g}{unit}"
+
+
+def parse_size(size: str | int) -> int:
+    """Returns the bytes in an ImageMagick resource size, e.g. 256MiB."""
+    text = str(size).strip()
+    number = text.rstrip("BbKkMmGgTtIi")
+    unit = text[len(number) :].upper().removesuffix("B").removesuffix("I")
+    power = ["", "K", "M", "G", "T"].index(unit)
+    return int(float(number) * (1024 if "I" in text.upper() else 1000) ** power)
@@ -3,6 +3,11 @@
 import logging
 import sqlite3
 from dataclasses import dataclass
+from typing import Final
+
+# stored as PRAGMA user_version once the tables, columns and indexes below
+# exist; bump it whenever they change
+SCHEMA: Final[int] = 1
 
 
 @dataclass(init=False)
@@ -14,23 +19,196 @@ class DbManager:
         self.transaction = False
         self.conn = sqlite3.connect(self.filename)
         self.cursor = self.conn.cursor()
+        query: str = "PRAGMA user_version;"
+        if self.cursor.execute(query).fetchone()[0] != SCHEMA:
+            self.__create__()
+
+    def __create__(self) -> None:
         script: str = """CREATE TABLE IF NOT EXISTS t_files(
             ID INTEGER PRIMARY KEY AUTOINCREMENT,
             file TEXT UNIQUE NOT NULL,
+            size INTEGER,
+            mtime INTEGER,
+            skip INTEGER NOT NULL DEFAULT 0,
+            style TEXT,
+            pos INTEGER,
+            width INTEGER,
+            height INTEGER,
+            orientation TEXT,
+            colors INTEGER,
+            exif TEXT,
+            palette TEXT,
+            digest TEXT,
+            phash TEXT,
+            grp TEXT,
             created DATETIME DEFAULT CURRENT_TIMESTAMP);
 
-            CREATE UNIQUE INDEX IF NOT EXISTS i_files ON t_files(ID, file);"""
+            CREATE UNIQUE INDEX IF NOT EXISTS i_files ON t_files(ID, file);
+
+            CREATE TABLE IF NOT EXISTS t_rules(
+            file TEXT PRIMARY KEY,
+            skip INTEGER NOT NULL DEFAULT 0,
+            style TEXT,
+            updated DATETIME DEFAULT CURRENT_TIMESTAMP);
+
+            CREATE TABLE IF NOT EXISTS t_state(
+            key TEXT PRIMARY KEY,
+            value TEXT);
+
+            CREATE TABLE IF NOT EXISTS t_history(
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            file TEXT NOT NULL,
+            style TEXT,
+            shown DATETIME DEFAULT CURRENT_TIMESTAMP);
+
+            CREATE INDEX IF NOT EXISTS i_history ON t_history(file);
+
+            CREATE TABLE IF NOT EXISTS t_cache(
+            key TEXT PRIMARY KEY,
+            file TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            used REAL NOT NULL);
+
+            CREATE INDEX IF NOT EXISTS i_cache ON t_cache(used);
+
+            CREATE TABLE IF NOT EXISTS t_queue(
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            file TEXT NOT NULL);"""
+        self.cursor.executescript(script)
+        added = self.__upgrade__(
+            "t_files",
+            {
+                "size": "INTEGER",
+                "mtime": "INTEGER",
+                "skip": "INTEGER NOT NULL DEFAULT 0",
+                "style": "TEXT",
+                "pos": "INTEGER",
+                "width": "INTEGER",
+                "height": "INTEGER",
+                "orientation": "TEXT",
+                "colors": "INTEGER",
+                "exif": "TEXT",
+                "palette": "TEXT",
+                "digest": "TEXT",
+                "phash": "TEXT",
+                "grp": "TEXT",
+            },
+        )
+        script = """CREATE INDEX IF NOT EXISTS i_pos ON t_files(pos);
+
+            CREATE INDEX IF NOT EXISTS i_width ON t_files(width);
+
+            CREATE INDEX IF NOT EXISTS i_digest ON t_files(digest);
+
+            CREATE INDEX IF NOT EXISTS i_grp ON t_files(grp);"""
         self.cursor.executescript(script)
+        if "pos" in added:
+            self.__renumber__()
+        # recorded last, so an interrupted upgrade is run again
+        self.cursor.execute(f"PRAGMA user_version = {SCHEMA};")
+        self.conn.commit()
 
-    def add_to_repo(self, file: str) -> None:
-        query: str = "SELECT COUNT(*) FROM t_files WHERE file=?;"
-        params = (file,)
-        response = self.cursor.execute(query, params)
-        if response.fetchone()[0] == 0:
-            query = "INSERT INTO t_files(file) VALUES(?);"
-            self.cursor.execute(query, params)
-            if not self.transaction:
-                self.conn.commit()
+    def __cursor__(self) -> int:
+        query: str = "SELECT value FROM t_state WHERE key='cursor';"
+        result = self.cursor.execute(query).fetchone()
+        return 0 if result is None else min(int(result[0]), self.__last_pos__() + 1)
+
+    def __last_pos__(self) -> int:
+        query: str = "SELECT MAX(pos) FROM t_files;"
+        result = self.cursor.execute(query).fetchone()[0]
+        return -1 if result is None else result
+
+    def __move__(self, source: int, target: int) -> None:
+        if source != target:
+            query: str = "UPDATE t_files SET pos=? WHERE pos=?;"
+            self.cursor.execute(query, (target, source))
+
+    def __promote__(self, group: str | None) -> None:
+        # another copy stands in for a group that lost its numbered file,
+        # unless one of its copies is skipped, which skips the whole group
+        if group is None:
+            return
+        query: str = """SELECT ID FROM t_files WHERE grp=?1 AND skip=0 AND NOT EXISTS
+            (SELECT 1 FROM t_files WHERE grp=?1 AND (pos IS NOT NULL OR skip=1))
+            ORDER BY ID LIMIT 1;"""
+        result = self.cursor.execute(query, (group,)).fetchone()
+        if result is not None:
+            query = "UPDATE t_files SET pos=? WHERE ID=?;"
+            self.cursor.execute(query, (self.__last_pos__() + 1, result[0]))
+
+    def __release__(self, pos: int) -> None:
+        # keeps positions dense: the last eligible file takes the freed slot;
+        # below the cursor, the last file shown this cycle takes it instead
+        last = self.__last_pos__()
+        cursor = self.__cursor__()
+        query: str = "UPDATE t_files SET pos=NULL WHERE pos=?;"
+        self.cursor.execute(query, (pos,))
+        if pos < cursor:
+            cursor -= 1
+            self.__move__(cursor, pos)
+            self.__move__(last, cursor)
+            self.__set_cursor__(cursor)
+        else:
+            self.__move__(last, pos)
+
+    def __renumber__(self) -> None:
+        logging.info("Numbering eligible files")
+        query: str = "UPDATE t_files SET pos=NULL;"
+        self.cursor.execute(query)
+        # a group of duplicates is numbered once, through its first file, and
+        # not at all if any of its copies is skipped
+        query = """SELECT ID FROM t_files WHERE skip=0 AND (grp IS NULL OR ID IN
+            (SELECT MIN(ID) FROM t_files GROUP BY grp HAVING MAX(skip)=0))
+            ORDER BY ID;"""
+        ids = [row[0] for row in self.cursor.execute(query).fetchall()]
+        query = "UPDATE t_files SET pos=? WHERE ID=?;"
+        self.cursor.executemany(query, enumerate(ids))
+        self.__set_cursor__(0)
+        self.conn.commit()
+
+    def __set_cursor__(self, cursor: int) -> None:
+        query: str = "INSERT OR REPLACE INTO t_state(key, value) VALUES('cursor', ?);"
+        self.cursor.execute(query, (str(cursor),))
+
+    def __upgrade__(self, table: str, columns: dict[str, str]) -> list[str]:
+        # catalogs created by older versions lack the newer columns
+        query: str = f"PRAGMA table_info({table});"
+        existing = {row[1] for row in self.cursor.execute(query).fetchall()}
+        added: list[str] = []
+        for column, definition in columns.items():
+            if column not in existing:
+                logging.info(f"Adding column {column} to {table}")
+                self.cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} {definition};"
+                )
+                added.append(column)
+        self.conn.commit()
+        return added
+
+    def add_files(self, files: list[tuple[str, int, int]]) -> None:
+        # files that come back keep the rules recorded for them
+        query: str = """INSERT OR IGNORE INTO t_files(file, size, mtime, skip, style, pos)
+            SELECT ?1, ?2, ?3, COALESCE(r.skip, 0), r.style,
+                CASE WHEN COALESCE(r.skip, 0) = 0
+                THEN (SELECT COALESCE(MAX(pos), -1) + 1 FROM t_files) END
+            FROM (SELECT 1) LEFT JOIN t_rules r ON r.file = ?1;"""
+        self.cursor.executemany(query, files)
+        if not self.transaction:
+            self.conn.commit()
+
+    def add_cache_entry(self, key: str, file: str, size: int, used: float) -> None:
+        query: str = (
+            "INSERT OR REPLACE INTO t_cache(key, file, bytes, used) VALUES(?, ?, ?, ?);"
+        )
+        self.cursor.execute(query, (key, file, size, used))
+        if not self.transaction:
+            self.conn.commit()
+
+    def add_history(self, file: str, style: str | None) -> None:
+        query: str = "INSERT INTO t_history(file, style) VALUES(?, ?);"
+        self.cursor.execute(query, (file, style))
+        if not self.transaction:
+            self.conn.commit()
 
     def begin(self) -> None:
         query: str = "BEGIN TRANSACTION;"
@@ -46,25 +224,291 @@ class DbManager:
             self.conn.commit()
             self.transaction = False
 
+    def get_cache_entries(self) -> list[tuple[str, str, int]]:
+        # least recently used first
+        query: str = "SELECT key, file, bytes FROM t_cache ORDER BY used;"
+        return self.cursor.execute(query).fetchall()
+
+    def get_cache_entry(self, key: str) -> str | None:
+        query: str = "SELECT file FROM t_cache WHERE key=?;"
+        result = self.cursor.execute(query, (key,)).fetchone()
+        return None if result is None else result[0]
+
+    def get_cache_size(self) -> int:
+        query: str = "SELECT COALESCE(SUM(bytes), 0) FROM t_cache;"
+        return self.cursor.execute(query).fetchone()[0]
+
     def get_count(self) -> int:
         query: str = "SELECT COUNT(*) FROM t_files;"
         response = self.cursor.execute(query)
         return response.fetchone()[0]
 
-    def get_nth_file(self, n: int) -> str:
-        query: str = """SELECT file, ID FROM t_files WHERE ID=?
-            + (SELECT seq FROM sqlite_sequence WHERE name=?)
-            - (SELECT COUNT(*) FROM t_files)
-            + 1;"""
-        params = (
-            n,
-            "t_files",
-        )
-        response = self.cursor.execute(query, params)
+    def get_file_stat(self, file: str) -> tuple[int | None, int | None] | None:
+        query: str = "SELECT size, mtime FROM t_files WHERE file=?;"
+        return self.cursor.execute(query, (file,)).fetchone()
+
+    def get_file_stats(self) -> dict[str, tuple[int | None, int | None]]:
+        query: str = "SELECT file, size, mtime FROM t_files;"
+        response = self.cursor.execute(query)
+        return {row[0]: (row[1], row[2]) for row in response}
+
+    def get_cursor(self) -> int:
+        return self.__cursor__()
+
+    def get_digest(self, file: str) -> str | None:
+        query: str = "SELECT digest FROM t_files WHERE file=?;"
+        result = self.cursor.execute(query, (file,)).fetchone()
+        return None if result is None or result[0] == "" else result[0]
+
+    def get_eligible_count(self) -> int:
+        return self.__last_pos__() + 1
+
+    def get_metadata(
+        self, file: str
+    ) -> tuple[int, int, str, int, int | None, str | None] | None:
+        query: str = """SELECT width, height, orientation, size, colors, exif
+            FROM t_files WHERE file=? AND width > 0;"""
+        return self.cursor.execute(query, (file,)).fetchone()
+
+    def get_nth_file(self, n: int) -> tuple[str, str | None]:
+        query: str = "SELECT file, style FROM t_files WHERE pos=?;"
+        response = self.cursor.execute(query, (n,))
         result = response.fetchone()
         logging.debug(f"{n} => {result}")
-        return result[0]
+        return result
+
+    def get_files_under(self, folder: str) -> list[str]:
+        # "0" follows "/", so the range holds every path below folder
+        query: str = "SELECT file FROM t_files WHERE file >= ? AND file < ?;"
+        response = self.cursor.execute(query, (folder + "/", folder + "0"))
+        return [row[0] for row in response]
+
+    def get_palette(self, file: str) -> str | None:
+        query: str = "SELECT palette FROM t_files WHERE file=?;"
+        result = self.cursor.execute(query, (file,)).fetchone()
+        return None if result is None else result[0]
+
+    def get_history(self) -> list[tuple[str, str | None, str]]:
+        query: str = "SELECT file, style, shown FROM t_history ORDER BY ID;"
+        return self.cursor.execute(query).fetchall()
+
+    def get_unfingerprinted(self) -> list[str]:
+        query: str = "SELECT file FROM t_files WHERE digest IS NULL ORDER BY ID;"
+        return [row[0] for row in self.cursor.execute(query)]
+
+    def get_unindexed(self) -> list[str]:
+        query: str = "SELECT file FROM t_files WHERE width IS NULL ORDER BY ID;"
+        return [row[0] for row in self.cursor.execute(query)]
+
+    def get_queue(self) -> list[tuple[str, str | None]]:
+        query: str = """SELECT f.file, f.style FROM t_queue q
+            JOIN t_files f ON f.file = q.file
+            WHERE f.pos IS NOT NULL ORDER BY q.ID;"""
+        return self.cursor.execute(query).fetchall()
+
+    def get_queue_length(self) -> int:
+        query: str = "SELECT COUNT(*) FROM t_queue;"
+        return self.cursor.execute(query).fetchone()[0]
+
+    def get_rule(self, file: str) -> tuple[bool, str | None] | None:
+        query: str = "SELECT skip, style FROM t_rules WHERE file=?;"
+        result = self.cursor.execute(query, (file,)).fetchone()
+        return None if result is None else (bool(result[0]), result[1])
+
+    def get_rules(self) -> dict[str, tuple[bool, str | None]]:
+        query: str = "SELECT file, skip, style FROM t_rules;"
+        response = self.cursor.execute(query)
+        return {row[0]: (bool(row[1]), row[2]) for row in response}
+
+    def get_state(self, key: str) -> str | None:
+        query: str = "SELECT value FROM t_state WHERE key=?;"
+        result = self.cursor.execute(query, (key,)).fetchone()
+        return None if result is None else result[0]
+
+    def pop_queue(self) -> tuple[str, str | None] | None:
+        # entries skipped or removed since they were queued are dropped
+        while True:
+            query: str = "SELECT ID, file FROM t_queue ORDER BY ID LIMIT 1;"
+            head = self.cursor.execute(query).fetchone()
+            if head is None:
+                return None
+            query = "DELETE FROM t_queue WHERE ID=?;"
+            self.cursor.execute(query, (head[0],))
+            if not self.transaction:
+                self.conn.commit()
+            query = "SELECT file, style FROM t_files WHERE file=? AND pos IS NOT NULL;"
+            result = self.cursor.execute(query, (head[1],)).fetchone()
+            if result is not None:
+                return result
+
+    def push_queue(self, file: str) -> None:
+        query: str = "INSERT INTO t_queue(file) VALUES(?);"
+        self.cursor.execute(query, (file,))
+        if not self.transaction:
+            self.conn.commit()
+
+    def regroup(self, match: str) -> None:
+        # match is "exact", "perceptual", or anything else for no groups
+        query: str = """UPDATE t_files SET grp=CASE ?
+            WHEN 'exact' THEN NULLIF(digest, '') WHEN 'perceptual' THEN phash END;"""
+        self.cursor.execute(query, (match,))
+        self.__renumber__()
+
+    def remove_cache_entries(self, keys: list[str]) -> None:
+        query: str = "DELETE FROM t_cache WHERE key=?;"
+        self.cursor.executemany(query, [(key,) for key in keys])
+        if not self.transaction:
+            self.conn.commit()
+
+    def remove_files(self, files: list[str]) -> None:
+        query: str = "SELECT pos, grp FROM t_files WHERE file=?;"
+        groups: set[str] = set()
+        for file in files:
+            result = self.cursor.execute(query, (file,)).fetchone()
+            if result is None:
+                continue
+            if result[0] is not None:
+                self.__release__(result[0])
+            # a group also comes back once its skipped copy is gone
+            if result[1] is not None:
+                groups.add(result[1])
+        query = "DELETE FROM t_files WHERE file=?;"
+        self.cursor.executemany(query, [(file,) for file in files])
+        for group in groups:
+            self.__promote__(group)
+        if not self.transaction:
+            self.conn.commit()
 
     def reset_repo(self) -> None:
         query: str = "DELETE FROM t_files"
         self.cursor.execute(query)
+        self.__set_cursor__(0)
+
+    def take_nth_file(self, n: int) -> tuple[str, str | None]:
+        # one step of Fisher-Yates: the file at n swaps places with the first
+        # one not shown this cycle, which the cursor then moves past
+        cursor = self.__cursor__()
+        query: str = """UPDATE t_files SET pos=CASE pos WHEN ?1 THEN ?2 ELSE ?1 END
+            WHERE pos IN (?1, ?2);"""
+        self.cursor.execute(query, (n, cursor))
+        self.__set_cursor__(cursor + 1)
+        if not self.transaction:
+            self.conn.commit()
+        return self.get_nth_file(cursor)
+
+    def touch_cache_entry(self, key: str, used: float) -> None:
+        query: str = "UPDATE t_cache SET used=? WHERE key=?;"
+        self.cursor.execute(query, (used, key))
+        if not self.transaction:
+            self.conn.commit()
+
+    def set_cursor(self, cursor: int) -> None:
+        self.__set_cursor__(cursor)
+        if not self.transaction:
+            self.conn.commit()
+
+    def set_fingerprints(
+        self, files: list[tuple[str, str, str | None]], match: str
+    ) -> None:
+        # a copy of a file already numbered, or of a skipped one, is taken out
+        # of the numbering
+        update: str = """UPDATE t_files SET digest=?2, phash=?3, grp=CASE ?4
+            WHEN 'exact' THEN NULLIF(?2, '') WHEN 'perceptual' THEN ?3 END
+            WHERE file=?1;"""
+        select: str = "SELECT pos, skip, grp FROM t_files WHERE file=?;"
+        numbered: str = """SELECT 1 FROM t_files
+            WHERE grp=? AND (pos IS NOT NULL OR skip=1) AND file<>?;"""
+        holder: str = "SELECT pos FROM t_files WHERE grp=? AND pos IS NOT NULL;"
+        for file, digest, phash in files:
+            self.cursor.execute(update, (file, digest, phash, match))
+            result = self.cursor.execute(select, (file,)).fetchone()
+            if result is None or result[2] is None:
+                continue
+            pos, skip, group = result
+            if skip:
+                # a skipped copy takes its new group out of the numbering
+                result = self.cursor.execute(holder, (group,)).fetchone()
+                if result is not None:
+                    self.__release__(result[0])
+            elif pos is not None:
+                if self.cursor.execute(numbered, (group, file)).fetchone() is not None:
+                    self.__release__(pos)
+        if not self.transaction:
+            self.conn.commit()
+
+    def set_metadata(
+        self, files: list[tuple[str, int, int, str, int | None, str | None]]
+    ) -> None:
+        query: str = """UPDATE t_files
+            SET width=?, height=?, orientation=?, colors=?, exif=? WHERE file=?;"""
+        self.cursor.executemany(query, [(*row[1:], row[0]) for row in files])
+        if not self.transaction:
+            self.conn.commit()
+
+    def set_palette(self, file: str, palette: str) -> None:
+        # files outside the catalog are simply not cached
+        query: str = "UPDATE t_files SET palette=? WHERE file=?;"
+        self.cursor.execute(query, (palette, file))
+        if not self.transaction:
+            self.conn.commit()
+
+    def set_rule(self, file: str, skip: bool, style: str | None) -> None:
+        if skip or style is not None:
+            query: str = """INSERT INTO t_rules(file, skip, style) VALUES(?, ?, ?)
+                ON CONFLICT(file) DO UPDATE SET
+                skip=excluded.skip, style=excluded.style, updated=CURRENT_TIMESTAMP;"""
+            self.cursor.execute(query, (file, int(skip), style))
+        else:
+            query = "DELETE FROM t_rules WHERE file=?;"
+            self.cursor.execute(query, (file,))
+        query = "SELECT pos, grp FROM t_files WHERE file=?;"
+        result = self.cursor.execute(query, (file,)).fetchone()
+        if result is None:
+            if not self.transaction:
+                self.conn.commit()
+            return
+        pos, group = result
+        if skip:
+            # skipping a copy skips its whole group, whichever file is numbered
+            query = "SELECT pos FROM t_files WHERE grp=? AND pos IS NOT NULL;"
+            numbered = self.cursor.execute(query, (group,)).fetchone()
+            if numbered is not None:
+                self.__release__(numbered[0])
+            elif pos is not None:
+                self.__release__(pos)
+            pos = None
+        elif pos is None:
+            # unless another copy already stands for its group or is skipped
+            query = """SELECT 1 FROM t_files
+                WHERE grp=? AND (pos IS NOT NULL OR skip=1) AND file<>?;"""
+            if self.cursor.execute(query, (group, file)).fetchone() is None:
+                pos = self.__last_pos__() + 1
+        query = "UPDATE t_files SET skip=?, style=?, pos=? WHERE file=?;"
+        self.cursor.execute(query, (int(skip), style, pos, file))
+        if not self.transaction:
+            self.conn.commit()
+
+    def set_state(self, key: str, value: str) -> None:
+        query: str = "INSERT OR REPLACE INTO t_state(key, value) VALUES(?, ?);"
+        self.cursor.execute(query, (key, value))
+        if not self.transaction:
+            self.conn.commit()
+
+    def update_files(self, files: list[tuple[str, int, int]]) -> None:
+        # changed files are indexed again, and leave their group until then
+        select: str = "SELECT pos, skip, grp FROM t_files WHERE file=?;"
+        update: str = """UPDATE t_files SET size=?, mtime=?, width=NULL, height=NULL,
+            orientation=NULL, colors=NULL, exif=NULL, palette=NULL,
+            digest=NULL, phash=NULL, grp=NULL, pos=? WHERE file=?;"""
+        for file, size, mtime in files:
+            result = self.cursor.execute(select, (file,)).fetchone()
+            if result is None:
+                continue
+            pos, skip, group = result
+            if pos is None and skip == 0:
+                pos = self.__last_pos__() + 1
+                group = None
+            self.cursor.execute(update, (size, mtime, pos, file))
+            self.__promote__(group)
+        if not self.transaction:
+            self.conn.commit()
@@ -16,8 +16,14 @@ class Models:
     def __exit__(self, exc_type, exc_value, traceback):
         self.db.close()
 
-    def add_to_repo(self, file: str) -> None:
-        self.db.add_to_repo(file)
+    def add_files(self, files: list[tuple[str, int, int]]) -> None:
+        self.db.add_files(files)
+
+    def add_cache_entry(self, key: str, file: str, size: int, used: float) -> None:
+        self.db.add_cache_entry(key, file, size, used)
+
+    def add_history(self, file: str, style: str | None) -> None:
+        self.db.add_history(file, style)
 
     def begin(self) -> None:
         self.db.begin()
@@ -25,11 +31,116 @@ class Models:
     def commit(self) -> None:
         self.db.commit()
 
+    def get_cache_entries(self) -> list[tuple[str, str, int]]:
+        return self.db.get_cache_entries()
+
+    def get_cache_entry(self, key: str) -> str | None:
+        return self.db.get_cache_entry(key)
+
+    def get_cache_size(self) -> int:
+        return self.db.get_cache_size()
+
     def get_count(self) -> int:
         return self.db.get_count()
 
-    def get_nth_file(self, n: int) -> str:
+    def get_file_stat(self, file: str) -> tuple[int | None, int | None] | None:
+        return self.db.get_file_stat(file)
+
+    def get_file_stats(self) -> dict[str, tuple[int | None, int | None]]:
+        return self.db.get_file_stats()
+
+    def get_files_under(self, folder: str) -> list[str]:
+        return self.db.get_files_under(folder)
+
+    def get_cursor(self) -> int:
+        return self.db.get_cursor()
+
+    def get_digest(self, file: str) -> str | None:
+        return self.db.get_digest(file)
+
+    def get_eligible_count(self) -> int:
+        return self.db.get_eligible_count()
+
+    def get_metadata(
+        self, file: str
+    ) -> tuple[int, int, str, int, int | None, str | None] | None:
+        return self.db.get_metadata(file)
+
+    def get_nth_file(self, n: int) -> tuple[str, str | None]:
         return self.db.get_nth_file(n)
 
+    def get_palette(self, file: str) -> str | None:
+        return self.db.get_palette(file)
+
+    def get_history(self) -> list[tuple[str, str | None, str]]:
+        return self.db.get_history()
+
+    def get_unfingerprinted(self) -> list[str]:
+        return self.db.get_unfingerprinted()
+
+    def get_unindexed(self) -> list[str]:
+        return self.db.get_unindexed()
+
+    def get_queue(self) -> list[tuple[str, str | None]]:
+        return self.db.get_queue()
+
+    def get_queue_length(self) -> int:
+        return self.db.get_queue_length()
+
+    def get_rule(self, file: str) -> tuple[bool, str | None] | None:
+        return self.db.get_rule(file)
+
+    def get_rules(self) -> dict[str, tuple[bool, str | None]]:
+        return self.db.get_rules()
+
+    def get_state(self, key: str) -> str | None:
+        return self.db.get_state(key)
+
+    def pop_queue(self) -> tuple[str, str | None] | None:
+        return self.db.pop_queue()
+
+    def push_queue(self, file: str) -> None:
+        self.db.push_queue(file)
+
+    def regroup(self, match: str) -> None:
+        self.db.regroup(match)
+
+    def remove_cache_entries(self, keys: list[str]) -> None:
+        self.db.remove_cache_entries(keys)
+
+    def remove_files(self, files: list[str]) -> None:
+        self.db.remove_files(files)
+
     def reset_repo(self) -> None:
         self.db.reset_repo()
+
+    def take_nth_file(self, n: int) -> tuple[str, str | None]:
+        return self.db.take_nth_file(n)
+
+    def touch_cache_entry(self, key: str, used: float) -> None:
+        self.db.touch_cache_entry(key, used)
+
+    def set_cursor(self, cursor: int) -> None:
+        self.db.set_cursor(cursor)
+
+    def set_fingerprints(
+        self, files: list[tuple[str, str, str | None]], match: str
+    ) -> None:
+        self.db.set_fingerprints(files, match)
+
+    def set_metadata(
+        self, files: list[tuple[str, int, int, str, int | None, str | None]]
+    ) -> None:
+        self.db.set_metadata(files)
+
+    def set_palette(self, file: str, palette: str) -> None:
+        self.db.set_palette(file, palette)
+
+    def set_rule(self, file: str, skip: bool, style: str | None) -> None:
+        self.db.set_rule(file, skip, style)
+
+    def set_state(self, key: str, value: str) -> None:
+        self.db.set_state(key, value)
+
+    def update_files(self, files: list[tuple[str, int, int]]) -> None:
+        self.db.update_files(files)
@@ -0,0 +1,116 @@
+# modules/profile.py
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Final, Iterator
+
+LOG: Final[str] = "/tmp/changer_profile.jsonl"
+
+
+@dataclass
+class Profiler:
+    """Times nested spans of work when enabled, and does nothing otherwise.
+
+    Spans are appended to LOG as JSON lines. report() also prints a summary
+    of this run next to the totals of every profiled run, which are kept in
+    the stats file.
+    """
+
+    stats: str | None = None
+    spans: list[dict] = field(default_factory=list)
+    local: threading.local = field(default_factory=threading.local)
+    origin: float = field(default_factory=time.perf_counter)
+    run: str = ""
+
+    def enable(self, stats: str) -> None:
+        self.stats = stats
+        self.run = time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}"
+
+    def enabled(self) -> bool:
+        return self.stats is not None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[None]:
+        if self.stats is None:
+            yield
+            return
+        # each thread keeps its own stack, so workers start at the top level
+        stack = self.local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if len(stack) > 0 else None
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            self.spans.append(
+                {
+                    "run": self.run,
+                    "name": name,
+                    "parent": parent,
+                    "depth": len(stack),
+                    "thread": threading.current_thread().name,
+                    "start": round(start - self.origin, 6),
+                    "duration": round(duration, 6),
+                    **attributes,
+                }
+            )
+
+    def __load__(self) -> dict:
+        try:
+            with open(self.stats, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def report(self) -> None:
+        if self.stats is None or len(self.spans) == 0:
+            return
+        spans = sorted(self.spans, key=lambda s: s["start"])
+        self.spans = []
+        with open(LOG, "a") as f:
+            for s in spans:
+                f.write(json.dumps(s) + "\n")
+        current: dict[str, list[float]] = {}
+        for s in spans:
+            current.setdefault(s["name"], []).append(s["duration"])
+        totals = self.__load__()
+        for name, durations in current.items():
+            total = totals.setdefault(
+                name, {"count": 0, "total": 0.0, "min": None, "max": 0.0}
+            )
+            total["count"] += len(durations)
+            total["total"] += sum(durations)
+            total["max"] = max(durations + [total["max"]])
+            if total["min"] is not None:
+                durations = durations + [total["min"]]
+            total["min"] = min(durations)
+        try:
+            os.makedirs(os.path.dirname(self.stats), exist_ok=True)
+            with open(self.stats + ".tmp", "w") as f:
+                json.dump(totals, f, indent=4)
+            os.replace(self.stats + ".tmp", self.stats)
+        except OSError as e:
+            logging.warning(f"Cannot keep profile stats in {self.stats}: {e}")
+        print(
+            f"{'span':<28}{'count':>6}{'total ms':>11}{'mean ms':>10}"
+            f"{'ever':>8}{'all mean':>10}{'all max':>10}"
+        )
+        for name, durations in current.items():
+            total = totals[name]
+            print(
+                f"{name:<28}{len(durations):>6}{sum(durations) * 1000:>11.1f}"
+                f"{sum(durations) / len(durations) * 1000:>10.1f}"
+                f"{total['count']:>8}{total['total'] / total['count'] * 1000:>10.1f}"
+                f"{total['max'] * 1000:>10.1f}"
+            )
+
+
+PROFILER: Final[Profiler] = Profiler()
+span = PROFILER.span
@@ -0,0 +1,192 @@
+# modules/sysinfo.py
+
+import fcntl
+import ipaddress
+import json
+import logging
+import os
+import platform
+import socket
+import struct
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Final
+
+from modules.desktop import detect
+from modules.system import execute
+
+# seconds each field stays valid; SESSION lasts until the next boot
+SESSION: Final[int] = -1
+LIFETIMES: Final[dict[str, int]] = {
+    "uptime": 0,
+    "python": SESSION,
+    "magick": SESSION,
+    "desktop": 0,  # detect() keeps it for as long as the session lasts
+    "shell": SESSION,
+    "kernel": SESSION,
+    "os": SESSION,
+    "addresses": 60,
+    "external": 3600,
+}
+SIOCGIFADDR: Final[int] = 0x8915
+SIOCGIFNETMASK: Final[int] = 0x891B
+
+
+def read_file(file: str) -> str:
+    try:
+        with open(file, "r") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def read_release(file: str) -> dict[str, str]:
+    values: dict[str, str] = {}
+    for line in read_file(file).splitlines():
+        if "=" in line and not line.startswith("#"):
+            key, value = line.split("=", 1)
+            values[key.strip()] = value.strip().strip("\"'")
+    return values
+
+
+def pretty_duration(seconds: float) -> str:
+    # same wording as uptime --pretty
+    minutes = int(seconds // 60)
+    parts = []
+    for name, size in [("year", 525600), ("week", 10080), ("day", 1440), ("hour", 60)]:
+        if minutes >= size:
+            count, minutes = divmod(minutes, size)
+            parts.append(f"{count} {name}{'s' if count > 1 else ''}")
+    if minutes > 0 or len(parts) == 0:
+        parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
+    return "Up " + ", ".join(parts)
+
+
+@dataclass
+class SysInfo:
+    """Collects the system panel without forking, except for a few version
+    strings that are looked up once per session.
+
+    Field values are cached in module["file"] with lifetimes taken from
+    LIFETIMES, which module["lifetimes"] can override.
+    """
+
+    module: dict
+    cache: dict = field(default_factory=dict)
+
+    def __addresses__(self) -> str:
+        ipv6: dict[str, list[str]] = {}
+        for line in read_file("/proc/net/if_inet6").splitlines():
+            params = line.split()
+            if len(params) == 6:
+                address = ipaddress.IPv6Address(int(params[0], 16))
+                ipv6.setdefault(params[5], []).append(f"{address}/{int(params[2], 16)}")
+        lines = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for _, name in socket.if_nameindex():
+                if name == "lo":
+                    continue
+                lines.append(f"{name}:")
+                request = struct.pack("256s", name.encode()[:15])
+                try:
+                    address = fcntl.ioctl(s.fileno(), SIOCGIFADDR, request)[20:24]
+                    netmask = fcntl.ioctl(s.fileno(), SIOCGIFNETMASK, request)[20:24]
+                    prefix = bin(int.from_bytes(netmask, "big")).count("1")
+                    lines.append(f"  {socket.inet_ntoa(address)}/{prefix}")
+                except OSError:
+                    pass  # no IPv4 address
+                lines += [f"  {address}" for address in ipv6.get(name, [])]
+        return "\n".join(lines)
+
+    def __compute__(self, name: str) -> str:
+        if name == "uptime":
+            uptime = float(read_file("/proc/uptime").split()[0])
+            since = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(time.time() - uptime)
+            )
+            return f"{pretty_duration(uptime)} since {since}"
+        elif name == "python":
+            return f"Python {platform.python_version()}"
+        elif name == "magick":
+            _, out, _ = execute(["magick", "-version"])
+            line = out.splitlines()[0] if out else ""
+            return line.replace("Version: ", "").split("http")[0]
+        elif name == "desktop":
+            return detect().version
+        elif name == "shell":
+            _, out, _ = execute([os.getenv("SHELL", "/bin/sh"), "--version"])
+            return out.split("\n")[0]
+        elif name == "kernel":
+            uname = os.uname()
+            return f"{uname.nodename} {uname.release} {uname.version} GNU/Linux"
+        elif name == "os":
+            return self.__os__()
+        elif name == "addresses":
+            return self.__addresses__()
+        elif name == "external":
+            return self.__external__()
+        return ""
+
+    def __external__(self) -> str:
+        url = f"https://ipinfo.io/?token={self.module['token']}"
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                data = json.load(response)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cannot reach ipinfo.io: {e}")
+            return ""
+        return f"{data.get('ip')} {data.get('city')}/{data.get('region')}/{data.get('postal')}/{data.get('country')} ({data.get('org')})"
+
+    def __field__(self, name: str, session: str) -> str:
+        lifetime = self.module.get("lifetimes", {}).get(name, LIFETIMES[name])
+        cached = self.cache.get(name)
+        if cached is not None:
+            if lifetime == SESSION and cached["session"] == session:
+                return cached["value"]
+            if lifetime > 0 and time.time() < cached["expires"]:
+                return cached["value"]
+        try:
+            value = self.__compute__(name)
+        except (OSError, ValueError, IndexError) as e:
+            logging.warning(f"Cannot collect {name}: {e}")
+            value = ""
+        if len(value) == 0:
+            return value  # try again next time
+        self.cache[name] = {
+            "value": value,
+            "session": session,
+            "expires": time.time() + max(lifetime, 0),
+        }
+        return value
+
+    def __os__(self) -> str:
+        release = read_release("/etc/os-release")
+        release.update(read_release("/etc/lsb-release"))
+        pretty = release.get("PRETTY_NAME", "")
+        if release.get("ID") == "manjaro":
+            return f'{release.get("NAME")} {release.get("DISTRIB_RELEASE")} "{release.get("DISTRIB_CODENAME")}"'
+        elif release.get("ID") == "nixos":
+            _, out, _ = execute(["nixos-rebuild", "list-generations", "--json"])
+            try:
+                current = [g for g in json.loads(out) if g.get("current")][0]
+            except (ValueError, IndexError):
+                return pretty
+            return f"{pretty} #{current['generation']} version {current['nixosVersion']} {current['date']}"
+        elif len(release.get("VERSION_CODENAME", "")) == 0:
+            return pretty
+        return f'{pretty} "{release["VERSION_CODENAME"]}"'
+
+    def collect(self) -> str:
+        file = self.module["file"]
+        try:
+            with open(file, "r") as f:
+                self.cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.cache = {}
+        session = read_file("/proc/sys/kernel/random/boot_id").strip()
+        lines = [self.__field__(name, session) for name in LIFETIMES]
+        with open(file + ".tmp", "w") as f:
+            json.dump(self.cache, f)
+        os.replace(file + ".tmp", file)
+        return "\n".join(line for line in lines if len(line) > 0)
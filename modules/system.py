@@ -1,12 +1,16 @@
 # modules/system.py
 
+import itertools
 import logging
 import os
-import stat
+import re
+import shlex
 import subprocess
 import tempfile
-from dataclasses import dataclass
-from typing import List, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+from modules.profile import span
 
 
 @dataclass
@@ -17,6 +21,9 @@ class System:
         return self
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.cleanup()
+
+    def cleanup(self) -> None:
         try:
             trash = self.config["files"]["trash"]
         except AttributeError:
@@ -40,47 +47,147 @@ class System:
             return f.name
 
 
-@dataclass(init=False)
-class Script:
-    system: System
-    filename: str
+class PlanError(Exception):
+    pass
+
+
+@dataclass
+class Step:
+    label: str
+    argv: List[str] | None = None
+    function: Callable[..., Any] | None = None
+    args: Tuple = ()
+    env: dict[str, str] | None = None
+    after: List["Step"] = field(default_factory=list)
+    result: Any = None
+    failed: bool = False
+
+    def command(self) -> str:
+        if self.argv is not None:
+            return shlex.join(self.argv)
+        return f"# in process: {self.function.__qualname__}"
+
 
-    def __init__(self, system: System) -> None:
-        self.system = system
-        self.reset()
+@dataclass
+class Plan:
+    """Commands kept in memory as argv lists, or Python calls, each run as
+    soon as the steps it comes after are done, independent ones concurrently.
+
+    A step can only come after steps added before it, so the list of steps
+    is always in an order that also works serially, which is how script()
+    prints it for debugging. A command returning non-zero or a call raising
+    fails its step, and the steps after it are skipped.
+    """
+
+    steps: List[Step] = field(default_factory=list)
+    deferred: List[Tuple[Callable[..., Any], Tuple]] = field(default_factory=list)
+
+    def __run_step__(self, step: Step) -> Any:
+        with span(step.label):
+            if step.argv is not None:
+                return execute(step.argv, env=step.env)
+            return step.function(*step.args)
 
-    def append(self, command: str) -> None:
-        with open(self.filename, "a") as f:
-            f.write(command)
-            f.write("\n")
+    def add(
+        self,
+        argv: List[Any],
+        after: Iterable[Step | None] = (),
+        label: str | None = None,
+        env: dict[str, str] | None = None,
+    ) -> Step:
+        argv = [str(arg) for arg in argv]
+        step = Step(label or os.path.basename(argv[0]), argv=argv, env=env)
+        step.after = [s for s in after if s is not None]
+        self.steps.append(step)
+        return step
+
+    def call(
+        self,
+        function: Callable[..., Any],
+        *args,
+        after: Iterable[Step | None] = (),
+        label: str | None = None,
+    ) -> Step:
+        step = Step(label or function.__name__, function=function, args=args)
+        step.after = [s for s in after if s is not None]
+        self.steps.append(step)
+        return step
 
-    def reset(self) -> None:
-        self.filename = self.system.create_temp_file(suffix=".sh", mode="a")
-        self.append(f"#! {os.getenv('SHELL')}\n")
+    def defer(self, function: Callable[..., Any], *args) -> None:
+        """Calls function on the calling thread once every step has run, and
+        only if none failed, e.g. to record results in the catalog."""
+        self.deferred.append((function, args))
 
-    def run(self, *args) -> Tuple[int, str, str]:
+    def run(self) -> None:
+        steps, self.steps = self.steps, []
+        deferred, self.deferred = self.deferred, []
         if logging.getLogger().getEffectiveLevel() == logging.DEBUG:
-            logging.debug(self.filename)
-            with open(self.filename, "r") as f:
-                contents = f.read()
-                logging.debug(contents)
-        os.chmod(
-            self.filename,
-            stat.S_IRUSR
-            | stat.S_IWUSR
-            | stat.S_IXUSR
-            | stat.S_IRGRP
-            | stat.S_IXGRP
-            | stat.S_IROTH
-            | stat.S_IROTH
-            | stat.S_IXOTH,
-        )
-        return execute([self.filename, *args])
-
-
-def execute(command: List[str], shell: bool = False) -> Tuple[int, str, str]:
+            logging.debug(self.script(steps))
+        # steps of earlier plans have run already
+        done: set[int] = {id(a) for s in steps for a in s.after} - set(map(id, steps))
+        # imported here, as most runs of this program never start a pool
+        from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+        failed: List[Step] = []
+        with ThreadPoolExecutor() as pool:
+            running: dict[Future, Step] = {}
+            while len(steps) > 0 or len(running) > 0:
+                ready = [s for s in steps if all(id(a) in done for a in s.after)]
+                for step in ready:
+                    steps.remove(step)
+                    if any(a.failed for a in step.after):
+                        logging.warning(
+                            f"Skipping {step.label}: an earlier step failed"
+                        )
+                        step.failed = True
+                        done.add(id(step))
+                    else:
+                        running[pool.submit(self.__run_step__, step)] = step
+                if len(running) == 0:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        step.result = future.result()
+                    except Exception as e:
+                        logging.exception(e)
+                        step.failed = True
+                    else:
+                        # commands return (code, out, err) from execute()
+                        step.failed = step.argv is not None and step.result[0] != 0
+                        if step.failed:
+                            logging.error(f"{step.label} returned {step.result[0]}")
+                    if step.failed:
+                        failed.append(step)
+                    done.add(id(step))
+        if len(failed) > 0:
+            # nothing is recorded for results that were not produced
+            labels = ", ".join(step.label for step in failed)
+            raise PlanError(f"{len(failed)} step(s) failed: {labels}")
+        for function, args in deferred:
+            function(*args)
+
+    def script(self, steps: List[Step] | None = None) -> str:
+        """Returns the shell script equivalent to running the plan serially."""
+        steps = self.steps if steps is None else steps
+        numbers = {id(step): n for n, step in enumerate(steps, 1)}
+        lines = [f"#! {os.getenv('SHELL', '/bin/sh')}"]
+        for n, step in enumerate(steps, 1):
+            after = ", ".join(str(numbers[id(s)]) for s in step.after)
+            lines.append(
+                f"# {n}: {step.label}" + (f" (after {after})" if after else "")
+            )
+            lines.append(step.command())
+        return "\n".join(lines)
+
+
+def execute(
+    command: List[str], shell: bool = False, env: dict[str, str] | None = None
+) -> Tuple[int, str, str]:
     logging.debug(f"Running {command}")
-    result = subprocess.run(command, capture_output=True, shell=shell)
+    with span(f"exec:{os.path.basename(command[0])}"):
+        result = subprocess.run(command, capture_output=True, shell=shell, env=env)
     code = result.returncode
     out = result.stdout.decode()
     err = result.stderr.decode()
@@ -89,3 +196,81 @@ def execute(command: List[str], shell: bool = False) -> Tuple[int, str, str]:
     logging.debug(f"Return code: {code}")
     logging.debug(f"Output: {out}")
     return code, out, err
+
+
+def spawn(command: List[str]) -> None:
+    """Starts command detached from this process, ignoring its output."""
+    logging.debug(f"Spawning {command}")
+    subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def pool_map(
+    function: Callable[[Any], Any], items: Iterable[Any], workers: int
+) -> Iterator[Tuple[Any, Any]]:
+    """Yields (item, function(item)) in completion order.
+
+    Work is spread over a pool of worker processes, with at most two
+    items per worker in flight so huge inputs are not queued up front.
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, function(item)
+        return
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    iterator = iter(items)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(function, item): item
+            for item in itertools.islice(iterator, workers * 2)
+        }
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = futures.pop(future)
+                yield item, future.result()
+                for item in itertools.islice(iterator, 1):
+                    futures[pool.submit(function, item)] = item
+
+
+def scan(
+    path: str, recursive: bool, pattern: re.Pattern
+) -> Iterator[Tuple[str, int, int]]:
+    """Yields (file, size, mtime) for every matching file under path.
+
+    Mirrors glob.glob(path + "**", recursive=recursive): hidden entries are
+    ignored and symbolic links are followed, but each directory is visited
+    only once.
+    """
+    visited: set[str] = set()
+    folders = [path]
+    while folders:
+        folder = folders.pop()
+        real = os.path.realpath(folder)
+        if real in visited:
+            continue
+        visited.add(real)
+        try:
+            entries = os.scandir(folder)
+        except OSError as e:
+            logging.warning(f"Cannot read {folder}: {e}")
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir():
+                        if recursive:
+                            folders.append(entry.path)
+                    elif entry.is_file() and re.match(pattern, entry.path):
+                        info = entry.stat()
+                        yield entry.path, info.st_size, info.st_mtime_ns
+                except OSError:
+                    pass
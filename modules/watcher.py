@@ -0,0 +1,238 @@
+# modules/watcher.py
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import signal
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Final
+
+from modules.models.models import Models
+from modules.system import scan
+
+IN_CLOSE_WRITE: Final[int] = 0x00000008
+IN_MOVED_FROM: Final[int] = 0x00000040
+IN_MOVED_TO: Final[int] = 0x00000080
+IN_CREATE: Final[int] = 0x00000100
+IN_DELETE: Final[int] = 0x00000200
+IN_DELETE_SELF: Final[int] = 0x00000400
+IN_MOVE_SELF: Final[int] = 0x00000800
+IN_Q_OVERFLOW: Final[int] = 0x00004000
+IN_IGNORED: Final[int] = 0x00008000
+IN_ONLYDIR: Final[int] = 0x01000000
+IN_ISDIR: Final[int] = 0x40000000
+IN_NONBLOCK: Final[int] = 0o4000
+IN_CLOEXEC: Final[int] = 0o2000000
+MASK: Final[int] = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT: Final[struct.Struct] = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+@dataclass
+class Watcher:
+    """Keeps t_files in step with files.folders using inotify.
+
+    Events are coalesced: a batch is applied once no event has arrived for
+    files.watch.delay seconds, or files.watch.limit seconds after its first
+    one. When the kernel queue overflows, reconcile is called instead.
+    """
+
+    config: dict
+    catalog: Models
+    reconcile: Callable[[], None]
+    applied: Callable[[], None] | None = None
+    fd: int = -1
+    folders: dict[int, tuple[str, bool]] = field(default_factory=dict)
+    changed: set[str] = field(default_factory=set)
+    removed: set[str] = field(default_factory=set)
+    first: float | None = None
+    last: float = 0.0
+    overflow: bool = False
+
+    def __enter__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.pattern = re.compile(self.config["type"], re.IGNORECASE)
+        for folder in self.config["folders"]:
+            self.__watch__(folder["path"].rstrip("/"), folder["recursive"], False)
+        logging.info(f"Watching {len(self.folders)} folders")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        os.close(self.fd)
+
+    def __event__(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            logging.warning("inotify queue overflow, reconciling")
+            self.overflow = True
+            return
+        if mask & IN_IGNORED:
+            self.folders.pop(wd, None)
+            return
+        if wd not in self.folders:
+            return
+        folder, recursive = self.folders[wd]
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # the folder is gone from where it was watched
+            self.__forget__(folder)
+            return
+        if name.startswith("."):
+            return
+        path = os.path.join(folder, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.__forget__(path)
+            elif recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                self.__watch__(path, True, True)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.changed.discard(path)
+            self.removed.add(path)
+        elif re.match(self.pattern, path):
+            self.removed.discard(path)
+            self.changed.add(path)
+
+    def __forget__(self, path: str) -> None:
+        for wd, (folder, _) in list(self.folders.items()):
+            if folder == path or folder.startswith(path + "/"):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.folders[wd]
+        self.changed = {f for f in self.changed if not f.startswith(path + "/")}
+        self.removed.update(self.catalog.get_files_under(path))
+
+    def __watch__(self, path: str, recursive: bool, new: bool) -> None:
+        # mirrors scan(): hidden folders are skipped and links followed once
+        visited = {os.path.realpath(f) for f, _ in self.folders.values()}
+        pending = [path]
+        while pending:
+            folder = pending.pop()
+            real = os.path.realpath(folder)
+            if real in visited:
+                continue
+            visited.add(real)
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), MASK)
+            if wd < 0:
+                logging.warning(
+                    f"Cannot watch {folder}: {os.strerror(ctypes.get_errno())}"
+                )
+                continue
+            self.folders[wd] = (folder, recursive)
+            if recursive:
+                try:
+                    with os.scandir(folder) as entries:
+                        for entry in entries:
+                            if not entry.name.startswith(".") and entry.is_dir():
+                                pending.append(entry.path)
+                except OSError as e:
+                    logging.warning(f"Cannot read {folder}: {e}")
+        if new:
+            # files may have landed before the watch was in place
+            for file, _, _ in scan(path, recursive, self.pattern):
+                self.removed.discard(file)
+                self.changed.add(file)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def flush(self, force: bool = False) -> bool:
+        """Applies the pending batch when it is due, returning whether it did."""
+        if self.overflow:
+            self.overflow = False
+            self.changed.clear()
+            self.removed.clear()
+            self.first = None
+            self.reconcile()
+            return True
+        if self.first is None or (not force and self.timeout() > 0):
+            return False
+        self.first = None
+        inserted: list[tuple[str, int, int]] = []
+        updated: list[tuple[str, int, int]] = []
+        for file in self.changed:
+            try:
+                info = os.stat(file)
+            except OSError:
+                self.removed.add(file)
+                continue
+            known = self.catalog.get_file_stat(file)
+            if known is None:
+                inserted.append((file, info.st_size, info.st_mtime_ns))
+            elif known != (info.st_size, info.st_mtime_ns):
+                updated.append((file, info.st_size, info.st_mtime_ns))
+        removed = list(self.removed)
+        self.changed.clear()
+        self.removed.clear()
+        self.catalog.begin()
+        self.catalog.remove_files(removed)
+        self.catalog.update_files(updated)
+        self.catalog.add_files(inserted)
+        self.catalog.commit()
+        logging.info(
+            f"Watch: {len(inserted)} added, {len(updated)} updated, {len(removed)} removed"
+        )
+        if self.applied is not None and len(inserted) + len(updated) > 0:
+            self.applied()
+        return True
+
+    def read(self) -> None:
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT.unpack_from(buffer, offset)
+            offset += EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            self.__event__(wd, mask, os.fsdecode(name))
+        now = time.monotonic()
+        if self.first is None and (self.changed or self.removed):
+            self.first = now
+        self.last = now
+
+    def run(self) -> None:
+        """Applies events until SIGTERM or SIGINT."""
+        self.running = True
+
+        def stop(signum, frame) -> None:
+            logging.info(f"Received signal {signum}")
+            self.running = False
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        while self.running:
+            wait = min(self.timeout(), 1)
+            readable, _, _ = select.select([self], [], [], wait)
+            if len(readable) > 0:
+                self.read()
+            self.flush()
+        self.flush(True)
+
+    def timeout(self) -> float:
+        """Returns the seconds until the pending batch is due (1 if none)."""
+        if self.overflow:
+            return 0
+        if self.first is None:
+            return 1
+        watch = self.config.get("watch", {})
+        now = time.monotonic()
+        due = min(
+            self.last + watch.get("delay", 2), self.first + watch.get("limit", 30)
+        )
+        return max(due - now, 0)
@@ -0,0 +1,184 @@
+# modules/weather.py
+
+import json
+import logging
+import os
+import time
+import urllib.request
+from dataclasses import dataclass
+from typing import Callable, Final
+
+from modules.system import System, execute
+
+API: Final[str] = "https://api.openweathermap.org/data/2.5/weather"
+ICONS: Final[str] = "http://openweathermap.org/img/wn"
+TTL: Final[int] = 1800
+
+
+def fetch(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return response.read()
+
+
+def direction(deg: float) -> str:
+    return (
+        "N"
+        if deg > 348.75
+        else "NNW"
+        if deg > 326.75
+        else "NW"
+        if deg > 303.75
+        else "WNW"
+        if deg > 281.25
+        else "W"
+        if deg > 258.75
+        else "WSW"
+        if deg > 216.25
+        else "SW"
+        if deg > 213.75
+        else "SSW"
+        if deg > 191.25
+        else "S"
+        if deg > 168.75
+        else "SSE"
+        if deg > 146.25
+        else "SE"
+        if deg > 123.75
+        else "ESE"
+        if deg > 101.25
+        else "E"
+        if deg > 78.75
+        else "ENE"
+        if deg > 56.25
+        else "NE"
+        if deg > 33.75
+        else "NNE"
+        if deg > 11.25
+        else "N"
+    )
+
+
+@dataclass
+class Weather:
+    """Keeps the raw API response and the rendered panel of a weather module.
+
+    The API response is cached in module["data"] (default: the panel file
+    with a .json suffix) and considered fresh for module["ttl"] seconds.
+    Endpoints can be overridden with module["api"] and module["icons"], and
+    fetch replaced, e.g. to test against a local server.
+    """
+
+    module: dict
+    system: System
+    fetch: Callable[[str], bytes] = fetch
+
+    def __data_file__(self) -> str:
+        return self.module.get(
+            "data", os.path.splitext(self.module["file"])[0] + ".json"
+        )
+
+    def __load__(self) -> dict | None:
+        try:
+            with open(self.__data_file__(), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def __write_info__(self, data: dict, info: str) -> None:
+        with open(info, "w") as f:
+            f.write(f"{data['name']} - {data['sys']['country']}\n")
+            f.write(time.ctime(data["dt"]) + "\n")
+            w = data["weather"][0]
+            f.write(f"{w['main']} ({w['description']})\n")
+            c = data["main"]["temp"] - 273.15
+            f.write("{:.1f}°F = {:.1f}°C\n".format(c * 9 / 5 + 32, c))
+            f.write(f"Cloudiness: {data['clouds']['all']}%\n")
+            f.write(f"Humidity: {data['main']['humidity']}%\n")
+            if "visibility" in data:
+                v = data["visibility"]
+                f.write(
+                    "Visibility: {:.2f} mi = {:.2f} km\n".format(v / 1609, v / 1000)
+                )
+            wind = data["wind"]["speed"]
+            f.write(
+                "Wind: {:.1f} mph = {:.1f} km/h {}\n".format(
+                    wind * 2.23694, wind * 3.6, direction(data["wind"]["deg"])
+                )
+            )
+
+    def is_stale(self) -> bool:
+        cached = self.__load__()
+        ttl = self.module.get("ttl", TTL)
+        return cached is None or time.time() - cached["fetched"] >= ttl
+
+    def panel(self) -> str:
+        """Returns the panel file, rendering it only when there is none yet."""
+        file = self.module["file"]
+        if not os.path.isfile(file):
+            cached = self.__load__()
+            if cached is None:
+                self.refresh()
+            else:
+                self.render(cached["weather"])
+        return file
+
+    def refresh(self) -> None:
+        location = self.module["location"]
+        logging.info(f"Loading weather information for {location}")
+        api = self.module.get("api", API)
+        data = json.loads(self.fetch(f"{api}?{location}&appid={self.module['appid']}"))
+        # the data is only fresh once its panel exists, so a failed render is
+        # retried on the next refresh
+        self.render(data)
+        file = self.__data_file__()
+        with open(file + ".tmp", "w") as f:
+            json.dump({"fetched": time.time(), "weather": data}, f)
+        os.replace(file + ".tmp", file)
+
+    def __magick__(self, argv: list[str]) -> None:
+        code, _, err = execute(["magick", *argv])
+        if code != 0:
+            reason = err.strip() or f"magick returned {code}"
+            raise RuntimeError(f"Cannot render weather panel: {reason}")
+
+    def render(self, data: dict) -> None:
+        """Renders the panel for data, raising RuntimeError if magick fails,
+        in which case the current panel is left in place."""
+        module = self.module
+        info = self.system.create_temp_file(suffix=".txt", mode="w")
+        self.__write_info__(data, info)
+        code = data["weather"][0]["icon"]
+        icon = f"/tmp/changer_weather_{code}.png"
+        if not os.path.isfile(icon):
+            content = self.fetch(f"{module.get('icons', ICONS)}/{code}@2x.png")
+            with open(icon, "wb") as f:
+                f.write(content)
+        blur = self.system.create_temp_file(suffix=".png")
+        self.__magick__(
+            [
+                *[icon, "-resize", "110%", "-fill", "Black"],
+                *["-colorize", "50%", "-channel", "RGBA", "-blur", "2x2", blur],
+            ]
+        )
+        full = self.system.create_temp_file(suffix=".png")
+        self.__magick__(
+            [
+                *["-size", "100x100", "canvas:#ffffff40", "-gravity"],
+                *["Center", blur, "-composite", icon, "-composite", full],
+            ]
+        )
+        # readers never see a half-written panel
+        panel = self.system.create_temp_file(suffix=".png")
+        font = ["-font", module["font"], "-pointsize", str(module["size"])]
+        self.__magick__(
+            [
+                *["-size", "1024x640", "canvas:none", *font],
+                *["-gravity", module["gravity"], "-stroke", module["shadow"]],
+                *["-strokewidth", "2", "-annotate", module["offset"], f"@{info}"],
+                *["-channel", "RGBA", "-blur", "2x2"],
+                *["-stroke", "none", "-fill", module["color"]],
+                *["-annotate", module["offset"], f"@{info}"],
+                *[full, "-composite", panel],
+            ]
+        )
+        os.replace(panel, module["file"])
@@ -126,4 +126,10 @@ get_desktop() {
     fi
 }
 
-get_desktop
+# changer.py passes along what it has already detected for this session
+if [ -n "$CHANGER_DESKTOP" ]; then
+    DESKTOP=$CHANGER_DESKTOP
+    PID=$CHANGER_PID
+else
+    get_desktop
+fi
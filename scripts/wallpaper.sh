@@ -21,14 +21,35 @@ get_env() {
     fi
 }
 
+# Usage: wallpaper.sh <wallpaper> <blur> [<output> <index> <count>]
+# Without an output, the wallpaper is set on every monitor. Desktops that can
+# only span a single picture take the one for the first output.
+OUTPUT=$3
+INDEX=${4:-0}
+COUNT=${5:-1}
+# outputs are set one after the other, so only the last one pauses
+PAUSE=0
+[ $INDEX -eq $((COUNT - 1)) ] && PAUSE=1
+
 source scripts/desktop.sh
 alias awww='awww img --transition-type random'
 case $DESKTOP in
     bspwm | dwm | herbstluftwm | i3 | Qtile)
         # nitrogen --set-centered "$WALLPAPER"
-        feh --bg-center "$1"
+        if [ -n "$OUTPUT" ]; then
+            # feh takes one picture per monitor, in order, all at once
+            ln -sf "$1" /tmp/changer_feh_$INDEX
+            # links left by a configuration with more outputs
+            for LINK in /tmp/changer_feh_*; do
+                [ "${LINK#/tmp/changer_feh_}" -lt $COUNT ] 2>/dev/null || rm -f "$LINK"
+            done
+            feh --bg-center /tmp/changer_feh_*
+        else
+            feh --bg-center "$1"
+        fi
         ;;
     Budgie | Gnome)
+        [ $INDEX -eq 0 ] || exec sleep $PAUSE
         gsettings set org.gnome.desktop.background picture-uri "file://$1"
         gsettings set org.gnome.desktop.background picture-uri-dark "file://$1"
         # If PaperWM is enabled, then it's not enough to change the file; you must also change the filename
@@ -40,21 +61,27 @@ case $DESKTOP in
         fi
         ;;
     Cinnamon)
+        [ $INDEX -eq 0 ] || exec sleep $PAUSE
         gsettings set org.cinnamon.desktop.background picture-uri "file://$1"
         ;;
     Hyprland)
         # MONITOR=`hyprctl monitors | head -1 | awk '{print $2}'`
-        MONITOR=`hyprctl monitors | head -1 | cut -d ' ' -f 2`
+        MONITOR=${OUTPUT:-`hyprctl monitors | head -1 | cut -d ' ' -f 2`}
         (hyprctl hyprpaper unload $1 && hyprctl hyprpaper preload $1 && hyprctl hyprpaper wallpaper "$MONITOR, $1") > /dev/null
         # If you have the awww daemon running, you could comment out the lines above out and uncomment the one below
-        # awww "$1"
+        # awww "$1" ${OUTPUT:+--outputs "$OUTPUT"}
         ;;
     KDE)
         # It's not enough to change the file; you must also change the filename
-        WP=/tmp/changer_wallpaper_`date +'%Y%m%d_%H%M%S'`.jpeg
+        WP=/tmp/changer_wallpaper_${OUTPUT:+${OUTPUT}_}`date +'%Y%m%d_%H%M%S'`.jpeg
         cp -p $1 $WP
+        if [ -n "$OUTPUT" ]; then
+            SCREENS="desktops().filter(d => d.screen == $INDEX)"
+        else
+            SCREENS="desktops()"
+        fi
         plasma_qdbus_script="
-            desktops().forEach(d => {
+            $SCREENS.forEach(d => {
                 d.currentConfigGroup = Array(
                     \"Wallpaper\",
                     \"org.kde.image\",
@@ -64,26 +91,27 @@ case $DESKTOP in
             });"
         dbus-send --session --type=method_call --dest=org.kde.plasmashell /PlasmaShell org.kde.PlasmaShell.evaluateScript string:"$plasma_qdbus_script"
         dbus_exitcode="$?"
-        if [[ "$dbus_exitcode" -eq 0 && "${KDE_SESSION_VERSION}" -eq '6' ]]; then
+        if [[ "$dbus_exitcode" -eq 0 && "${KDE_SESSION_VERSION}" -eq '6' && $INDEX -eq 0 ]]; then
             # Update KDE lock screen background with a blurred copy
             magick $WP -channel RGBA -blur $2 $1
             kwriteconfig6 --file kscreenlockerrc --group Greeter --group Wallpaper --group org.kde.image --group General --key Image "$1"
         fi
         ;;
     MangoWC | niri | scroll)
-        awww "$1"
+        awww "$1" ${OUTPUT:+--outputs "$OUTPUT"}
         ;;
     MATE)
+        [ $INDEX -eq 0 ] || exec sleep $PAUSE
         gsettings set org.mate.background picture-filename "$1"
         ;;
     sway)
         export SWAYSOCK=$(ls /run/user/1000/sway-ipc.* | head -n 1)
-        swaymsg "output * bg $1 center" > /dev/null
+        swaymsg "output ${OUTPUT:-*} bg $1 center" > /dev/null
         ;;
     Xfce)
-        xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor$I/workspace0/image-style -s 5
-        xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor$I/workspace0/last-image -s "$1"
+        xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor${OUTPUT:-$I}/workspace0/image-style -s 5
+        xfconf-query -c xfce4-desktop -p /backdrop/screen0/monitor${OUTPUT:-$I}/workspace0/last-image -s "$1"
         ;;
 esac
 # a little break before removing temporary files
-sleep 1
+sleep $PAUSE